@@ -15,8 +15,9 @@ import os
 import time
 import json
 import traceback
+from functools import lru_cache
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import argparse
 
 # Configuration
@@ -30,23 +31,42 @@ PROGRESS_FILE = OUTPUT_FOLDER / "progress.json"
 # 1. PRE-FLIGHT VALIDATION
 # ─────────────────────────────────────────────────
 
+@lru_cache(maxsize=1)
+def _gt_index(mtime_ns):
+    """
+    One listing of GROUND_TRUTH_FOLDER, reused for every song in the batch.
+    mtime_ns is part of the memo key so added/removed files are picked up.
+    Returns ({file name: path}, {name[:20]: path}, [paths]).
+    """
+    files = list(GROUND_TRUTH_FOLDER.glob("*.txt"))
+    by_name = {f.name: f for f in files}
+    by_prefix = {}
+    for f in files:
+        by_prefix.setdefault(f.name[:20], f)
+    return by_name, by_prefix, files
+
+
 def _find_ground_truth(song_path):
     """Find matching ground truth lyrics file for a song. Returns Path or None."""
     song_path = Path(song_path)
     
-    # Priority 1: exact match  <song_name>.mp3.txt
-    exact = GROUND_TRUTH_FOLDER / f"{song_path.name}.txt"
-    if exact.exists():
-        return exact
+    try:
+        by_name, by_prefix, files = _gt_index(GROUND_TRUTH_FOLDER.stat().st_mtime_ns)
+    except OSError:
+        return None
     
+    # Priority 1: exact match  <song_name>.mp3.txt
     # Priority 2: stem match  <song_name>.txt
-    stem = GROUND_TRUTH_FOLDER / f"{song_path.stem}.txt"
-    if stem.exists():
-        return stem
+    for name in (f"{song_path.name}.txt", f"{song_path.stem}.txt"):
+        if name in by_name:
+            return by_name[name]
     
     # Priority 3: fuzzy match (first 20 chars of stem in filename)
-    for txt_file in GROUND_TRUTH_FOLDER.glob("*.txt"):
-        if song_path.stem[:20] in txt_file.name:
+    key = song_path.stem[:20]
+    if key in by_prefix:
+        return by_prefix[key]
+    for txt_file in files:
+        if key in txt_file.name:
             return txt_file
     
     return None
@@ -60,7 +80,10 @@ def validate_pairs():
     Prints a clear report showing matches, missing, and orphans.
     """
     song_files = sorted(INPUT_FOLDER.glob("*.mp3"))
-    txt_files = set(GROUND_TRUTH_FOLDER.glob("*.txt"))
+    try:
+        txt_files = set(_gt_index(GROUND_TRUTH_FOLDER.stat().st_mtime_ns)[2])
+    except OSError:
+        txt_files = set()
     
     pairs = []       # (mp3_path, txt_path)
     no_lyrics = []   # mp3 files with no matching txt
@@ -186,7 +209,7 @@ def process_single_song(mp3_path_str, txt_path_str):
     load_dotenv()
     
     import main as pipeline
-    from lyrics_extractor import extract_lyrics_from_text
+    from lyrics_extractor import extract_lyrics_from_file
     
     mp3_path = Path(mp3_path_str)
     txt_path = Path(txt_path_str)
@@ -201,8 +224,7 @@ def process_single_song(mp3_path_str, txt_path_str):
     
     try:
         # Read lyrics from the EXACT matched txt file (no ambiguity)
-        raw_text = open(txt_path, "r", encoding="utf-8").read()
-        ground_truth_text = extract_lyrics_from_text(raw_text)
+        ground_truth_text = extract_lyrics_from_file(txt_path)
         
         if not ground_truth_text or not ground_truth_text.strip():
             raise ValueError(f"Empty lyrics extracted from {txt_path.name}")
@@ -245,6 +267,28 @@ def process_single_song(mp3_path_str, txt_path_str):
         _release_lock(song_name)
 
 
+def _prefetch_punctuation(txt_path_str, song_name):
+    """
+    Run the Gemini punctuation call for a queued song ahead of time.
+    The result lands in the punctuation cache, so when the song's turn comes
+    pipeline.main() gets it without a network round-trip.
+    """
+    if (OUTPUT_FOLDER / song_name / "lyrics.json").exists():
+        return  # alignment will be skipped, so punctuation is never needed
+    
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    from lyrics_extractor import extract_lyrics_from_file, add_punctuation_with_gemini
+    
+    try:
+        lyrics_text = extract_lyrics_from_file(txt_path_str)
+        if lyrics_text.strip():
+            add_punctuation_with_gemini(lyrics_text)
+    except Exception as e:
+        print(f"  ⚠️  Punctuation prefetch failed for {song_name}: {e}")
+
+
 # ─────────────────────────────────────────────────
 # 5. BATCH ORCHESTRATOR
 # ─────────────────────────────────────────────────
@@ -321,8 +365,18 @@ def process_batch(max_workers=1, retry_failed=True):
     batch_start = time.time()
     
     if max_workers == 1:
-        # Sequential mode
+        # Sequential mode — while one song aligns and renders, the next
+        # song's Gemini punctuation is fetched on a background thread
+        prefetch_pool = ThreadPoolExecutor(max_workers=1)
+        prefetch = None
         for i, (mp3_path, txt_path) in enumerate(to_process, 1):
+            if prefetch is not None:
+                prefetch.result()  # don't race the pipeline for the same lyrics
+            prefetch = None
+            if i < remaining:
+                next_mp3, next_txt = to_process[i]
+                prefetch = prefetch_pool.submit(_prefetch_punctuation, str(next_txt), next_mp3.stem)
+            
             print(f"\n>>> [{i}/{remaining}] Processing: {mp3_path.name}")
             print(f"    Lyrics: {txt_path.name}")
             
@@ -346,6 +400,7 @@ def process_batch(max_workers=1, retry_failed=True):
             avg_time = elapsed / max(songs_done, 1)
             eta = avg_time * (remaining - songs_done)
             print(f"\n>>> Progress: {songs_done}/{remaining} | ✅ {results['success']} ❌ {results['failed']} | ETA: {eta/60:.0f} min")
+        prefetch_pool.shutdown()
     else:
         # Parallel mode — each worker gets a unique (mp3, txt) pair
         with ProcessPoolExecutor(max_workers=max_workers) as executor:
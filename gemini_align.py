@@ -6,12 +6,180 @@ word-level timestamps. Used as fallback when NeMo alignment is unavailable.
 """
 
 import os
-import json
 import re
+import json
+import io
 import base64
 import argparse
+import subprocess
+from collections import Counter
+from bisect import bisect_left
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
+
+from json_utils import _loads, _dumps
+
+def _q(x):
+    """
+    Quantize seconds to centiseconds, rounding the decimal half (x.xx5) away
+    from zero. Not round(x, 2): that follows the binary value, so e.g.
+    0.015 -> 0.01 and 0.125 -> 0.12 there but 0.02 and 0.13 here (about 4%
+    of millisecond inputs, each off by 0.01s).
+    """
+    return int(x * 100.0 + (0.5 if x >= 0 else -0.5)) / 100.0
+
+
+def _q_array(arr):
+    """Vectorized _q for NumPy arrays."""
+    return np.trunc(arr * 100.0 + np.copysign(0.5, arr)) / 100.0
+
+
+# Commas run into a "!" or "।" in segment text, e.g. "!," / ",।"; runs
+# without a comma ("।।", "!!", "!।") are kept as written
+_PUNCT_RUN_RE = re.compile(r",*[!।],+|,+[!।]")
+
+
+# Commas and purna viram separate words like whitespace when tokenizing lines
+_WORD_SEP_TABLE = str.maketrans(",।", "  ")
+
+# Everything that is not lyric content, for coverage checks
+_BARE_TEXT_RE = re.compile(r"[\s,!।.?|]+")
+
+
+def _collapse_punct_run(m):
+    return m.group().strip(",")
+
+
+# Structured-output schemas (Gemini OpenAPI subset) — the model returns raw JSON
+_WORDS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "word": {"type": "STRING"},
+            "start": {"type": "NUMBER"},
+            "end": {"type": "NUMBER"},
+        },
+        "required": ["word", "start", "end"],
+    },
+}
+
+_ALIGN_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "seg_index": {"type": "INTEGER"},
+            "words": _WORDS_SCHEMA,
+        },
+        "required": ["seg_index", "words"],
+    },
+}
+
+_SEGMENTS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "text": {"type": "STRING"},
+            "start": {"type": "NUMBER"},
+            "end": {"type": "NUMBER"},
+            "words": _WORDS_SCHEMA,
+        },
+        "required": ["text", "start", "end", "words"],
+    },
+}
+
+_ALIGN_SPLIT_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "seg_index": {"type": "INTEGER"},
+            "repetitions": {"type": "INTEGER"},
+            "words": _WORDS_SCHEMA,
+        },
+        "required": ["seg_index", "repetitions", "words"],
+    },
+}
+
+_REPETITIONS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "seg_index": {"type": "INTEGER"},
+            "repetitions": {"type": "INTEGER"},
+        },
+        "required": ["seg_index", "repetitions"],
+    },
+}
+
+
+@lru_cache(maxsize=1)
+def _load_vad():
+    """Load the pyannote VAD pipeline and its binarizer once per process."""
+    from whisperx.vads.pyannote import load_vad_model, Binarize
+    return load_vad_model("cpu"), Binarize(max_duration=30.0)
+
+
+def _probe_duration(audio_path):
+    """
+    Read the container duration without decoding: ffprobe, else mutagen when
+    installed. Returns None if neither can read it.
+    """
+    try:
+        probe = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=nw=1:nk=1", str(audio_path)],
+            capture_output=True, text=True, timeout=10,
+        )
+        return round(float(probe.stdout.strip()), 2)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        pass
+    try:
+        import mutagen  # optional: pure-Python tag/header reader
+        return round(mutagen.File(str(audio_path)).info.length, 2)
+    except Exception:
+        return None
+
+
+_GEMINI_API = "https://generativelanguage.googleapis.com"
+
+_AUDIO_MIME_TYPES = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".m4a": "audio/mp4", ".ogg": "audio/ogg"}
+
+
+def _audio_mime_type(audio_path):
+    return _AUDIO_MIME_TYPES.get(Path(audio_path).suffix.lower(), "audio/mpeg")
+
+
+def _inline_audio_part(audio_path):
+    """Base64-encode the audio file into an inlineData request part."""
+    audio_path = Path(audio_path)
+    if audio_path.stat().st_size <= 2 * 1024 * 1024:
+        audio_b64 = base64.b64encode(audio_path.read_bytes()).decode("ascii")
+    else:
+        # Encode in chunks so the raw file is never held alongside its encoding.
+        # Chunk size is a multiple of 3 so no padding appears mid-stream
+        # (base64.encode() would insert MIME line breaks, which Gemini rejects).
+        buf = io.BytesIO()
+        with open(audio_path, "rb") as f:
+            for chunk in iter(lambda: f.read(3 * 256 * 1024), b""):
+                buf.write(base64.b64encode(chunk))
+        audio_b64 = buf.getvalue().decode("ascii")
+    return {"inlineData": {"mimeType": _audio_mime_type(audio_path), "data": audio_b64}}
+
+
+def _last_text_part(parts):
+    """Return the last text part of a Gemini response (thinking parts come first)."""
+    for part in reversed(parts):
+        if "text" in part:
+            return part["text"]
+    return ""
+
+
 def align_lyrics_with_gemini(audio_path, lyrics_segments, api_key=None):
     """
     Send audio + lyrics to Gemini for precise word-level timestamps.
@@ -37,18 +205,13 @@ def align_lyrics_with_gemini(audio_path, lyrics_segments, api_key=None):
         print(f"WARNING: Audio file not found: {audio_path}")
         return lyrics_segments
     
-    audio_bytes = audio_path.read_bytes()
-    audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
-    
-    # Determine mime type
-    ext = audio_path.suffix.lower()
-    mime_map = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".m4a": "audio/mp4", ".ogg": "audio/ogg"}
-    mime_type = mime_map.get(ext, "audio/mpeg")
+    audio_part = _inline_audio_part(audio_path)
     
     # Build the lyrics text with segment timing hints
-    lyrics_text = ""
-    for i, seg in enumerate(lyrics_segments):
-        lyrics_text += f"Segment {i}: [{seg['start']:.2f}s - {seg['end']:.2f}s] \"{seg['text']}\"\n"
+    lyrics_text = "".join(
+        f"Segment {i}: [{seg['start']:.2f}s - {seg['end']:.2f}s] \"{seg['text']}\"\n"
+        for i, seg in enumerate(lyrics_segments)
+    )
     
     prompt = f"""You are an audio-to-word timestamp alignment tool. I'm giving you an audio file and its EXACT lyrics with FIXED segment timing.
 
@@ -88,18 +251,15 @@ Return ONLY the JSON array:"""
         payload = {
             "contents": [{
                 "parts": [
-                    {
-                        "inlineData": {
-                            "mimeType": mime_type,
-                            "data": audio_b64
-                        }
-                    },
+                    audio_part,
                     {"text": prompt}
                 ]
             }],
             "generationConfig": {
                 "temperature": 0.1,
                 "maxOutputTokens": 65536,
+                "responseMimeType": "application/json",
+                "responseSchema": _ALIGN_SCHEMA,
             }
         }
         
@@ -110,34 +270,13 @@ Return ONLY the JSON array:"""
                 print(f"  {model_name} failed: HTTP {response.status_code}", flush=True)
                 continue
             
-            result = response.json()
-            
-            # Gemini 2.5 Flash may return multiple parts (thinking + text)
-            parts = result["candidates"][0]["content"]["parts"]
-            text_response = ""
-            for part in parts:
-                if "text" in part:
-                    text_response = part["text"]
-                    if "[" in text_response and "]" in text_response:
-                        break
-            
-            # Parse JSON from response — strip markdown code blocks if present
-            clean = text_response.strip()
-            clean = re.sub(r'^```(?:json)?\s*', '', clean)
-            clean = re.sub(r'\s*```$', '', clean)
-            clean = clean.strip()
-            
-            # Find JSON array
-            start_idx = clean.find("[")
-            end_idx = clean.rfind("]") + 1
-            
-            if start_idx == -1 or end_idx == 0:
-                print(f"  {model_name}: No JSON array found in response", flush=True)
-                print(f"  Response preview: {clean[:200]}...", flush=True)
-                continue
+            result = _loads(response.content)
+            
+            # Gemini 2.5 Flash may return multiple parts (thinking + text);
+            # the answer is the last text part
+            text_response = _last_text_part(result["candidates"][0]["content"]["parts"])
             
-            json_str = clean[start_idx:end_idx]
-            aligned_data = json.loads(json_str)
+            aligned_data = _loads(text_response)
             
             if not isinstance(aligned_data, list) or len(aligned_data) == 0:
                 print(f"  {model_name}: Empty or invalid response", flush=True)
@@ -156,27 +295,8 @@ Return ONLY the JSON array:"""
             updated_count = 0
             for i, seg in enumerate(lyrics_segments):
                 if i in word_map:
-                    gemini_words = word_map[i]
-                    seg_start = seg["start"]
-                    seg_end = seg["end"]
-                    
-                    # Clamp word timestamps into segment boundaries
-                    clamped_words = []
-                    for w in gemini_words:
-                        ws = max(seg_start, min(w["start"], seg_end))
-                        we = max(ws + 0.05, min(w["end"], seg_end))
-                        # Cap word duration to 1.5s
-                        if we - ws > 1.5:
-                            we = round(ws + 1.5, 2)
-                        clamped_words.append({
-                            "word": w["word"],
-                            "start": round(ws, 2),
-                            "end": round(we, 2)
-                        })
-                    
-                    # Sort by start time
-                    clamped_words.sort(key=lambda w: w["start"])
-                    seg["words"] = clamped_words
+                    # Clamp word timestamps into segment boundaries (sorted by start)
+                    seg["words"] = _clamp_words(word_map[i], seg["start"], seg["end"])
                     updated_count += 1
             
             print(f"  SUCCESS: Updated {updated_count}/{len(lyrics_segments)} segments with Gemini word timing", flush=True)
@@ -198,6 +318,87 @@ Return ONLY the JSON array:"""
     return lyrics_segments
 
 
+def _bare_text(text):
+    """Lyric text without punctuation or whitespace, for coverage matching."""
+    return _BARE_TEXT_RE.sub("", text)
+
+
+def _fill_missing_lines(model_name, api_key, data, clean_lines, audio_duration):
+    """
+    Text-only follow-up for full_pipeline_gemini: give the model its own partial
+    alignment and ask it to time only the lyric lines it skipped.
+    Returns data with the new segments merged in (unchanged on failure).
+    """
+    import requests
+    
+    # Matched by occurrence, not substring: a chorus line sung 4 times needs 4
+    # returned segments, and a short line must not hide inside a longer one
+    covered = Counter(_bare_text(item.get("text", "")) for item in data)
+    missing = []
+    for i, line in enumerate(clean_lines):
+        bare = _bare_text(line)
+        if covered[bare] > 0:
+            covered[bare] -= 1
+        else:
+            missing.append((i, line))
+    if not missing:
+        return data
+    
+    partial = json.dumps(
+        [{"text": item.get("text", ""), "start": item.get("start"), "end": item.get("end")} for item in data],
+        ensure_ascii=False,
+    )
+    missing_text = "\n".join(f"L{i+1}: {line}" for i, line in missing)
+    
+    prompt = f"""You already aligned most lines of a song (audio duration {audio_duration:.1f}s), but these {len(missing)} lyric lines are missing:
+{missing_text}
+
+Your partial alignment (segments in time order):
+{partial}
+
+For EACH missing line, return one segment placed in the time gap where it belongs (between its neighbouring lines).
+- Do not return the segments you already gave
+- Add punctuation (, ! ।) as before
+- Word timestamps must lie inside the segment
+Return ONLY the JSON array of the missing segments."""
+    
+    url = f"{_GEMINI_API}/v1beta/models/{model_name}:generateContent?key={api_key}"
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "temperature": 0.1,
+            "maxOutputTokens": 16384,
+            "responseMimeType": "application/json",
+            "responseSchema": _SEGMENTS_SCHEMA,
+        }
+    }
+    
+    try:
+        response = requests.post(url, json=payload, timeout=120)
+        if response.status_code != 200:
+            print(f"  {model_name}: fill-in failed: HTTP {response.status_code}", flush=True)
+            return data
+        result = _loads(response.content)
+        extra = _loads(_last_text_part(result["candidates"][0]["content"]["parts"]))
+    except Exception as e:
+        print(f"  {model_name}: fill-in failed: {e}", flush=True)
+        return data
+    
+    if not isinstance(extra, list):
+        return data
+    # Keep at most one segment per missing line; duplicates and lines that
+    # were not asked for would inflate the coverage count
+    wanted = Counter(_bare_text(line) for _, line in missing)
+    kept = []
+    for item in extra:
+        bare = _bare_text(item.get("text", "")) if isinstance(item, dict) else ""
+        if bare and wanted[bare] > 0:
+            wanted[bare] -= 1
+            kept.append(item)
+    print(f"  {model_name}: fill-in returned {len(kept)}/{len(missing)} missing lines", flush=True)
+    return sorted(data + kept, key=lambda item: item.get("start", 0))
+
+
 def full_pipeline_gemini(audio_path, ground_truth_text, api_key=None):
     """
     FAST PATH: VAD (10s) + Gemini (1.5min) = ~2 min total.
@@ -220,23 +421,23 @@ def full_pipeline_gemini(audio_path, ground_truth_text, api_key=None):
     # ── Step 1: Pyannote VAD ──
     print("  Step 1: Voice Activity Detection...", flush=True)
     vad_start = time.time()
+    audio_duration = _probe_duration(audio_path)
+    audio_np = None
     
     try:
         import torch, whisperx
         audio_np = whisperx.load_audio(str(audio_path))
         sample_rate = 16000
-        audio_duration = round(len(audio_np) / sample_rate, 2)
+        if audio_duration is None:
+            audio_duration = round(len(audio_np) / sample_rate, 2)
         print(f"  Audio duration: {audio_duration:.1f}s", flush=True)
         
-        # Use pyannote VAD model for voice activity detection
-        from whisperx.vads.pyannote import load_vad_model, Binarize
-        
-        vad_pipeline = load_vad_model("cpu")
-        audio_tensor = torch.from_numpy(audio_np).unsqueeze(0)
+        # Use pyannote VAD model for voice activity detection (cached across songs)
+        vad_pipeline, binarize = _load_vad()
+        audio_tensor = torch.from_numpy(audio_np).unsqueeze_(0)
         vad_result = vad_pipeline({"waveform": audio_tensor, "sample_rate": sample_rate})
         
         # Binarize to get clean speech segments
-        binarize = Binarize(max_duration=30.0)
         speech_annotation = binarize(vad_result)
         
         speech_segments = []
@@ -247,11 +448,12 @@ def full_pipeline_gemini(audio_path, ground_truth_text, api_key=None):
         
     except Exception as e:
         print(f"  VAD failed: {e}. Using duration only.", flush=True)
-        try:
-            from mutagen.mp3 import MP3
-            audio_duration = round(MP3(str(audio_path)).info.length, 2)
-        except Exception:
-            audio_duration = 210.0
+        if audio_duration is None and audio_np is not None:
+            audio_duration = round(len(audio_np) / 16000, 2)
+        if audio_duration is None:
+            # Every timestamp is scaled to the duration, so don't guess one
+            print("  ERROR: Could not determine the audio duration (no VAD, ffprobe or mutagen).", flush=True)
+            return None
         speech_segments = [{"start": 0.0, "end": audio_duration}]
     
     # ── Step 2: Clean ground truth ──
@@ -262,8 +464,7 @@ def full_pipeline_gemini(audio_path, ground_truth_text, api_key=None):
             continue
         clean_lines.append(line)
     # Number each line so Gemini can't skip any
-    numbered_lines = [f"L{i+1}: {line}" for i, line in enumerate(clean_lines)]
-    numbered_text = "\n".join(numbered_lines)
+    numbered_text = "\n".join(f"L{i}: {line}" for i, line in enumerate(clean_lines, 1))
     total_lines = len(clean_lines)
     
     vad_info = "\n".join([f"  Speech: {s['start']:.1f}s - {s['end']:.1f}s" for s in speech_segments])
@@ -271,10 +472,7 @@ def full_pipeline_gemini(audio_path, ground_truth_text, api_key=None):
     # ── Step 3: Gemini with VAD hints ──
     print(f"  Step 2: Gemini alignment ({total_lines} lyric lines)...", flush=True)
     
-    audio_bytes = audio_path.read_bytes()
-    audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
-    ext = audio_path.suffix.lower()
-    mime_type = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".m4a": "audio/mp4"}.get(ext, "audio/mpeg")
+    audio_part = _inline_audio_part(audio_path)
     
     prompt = f"""I have an audio file and {total_lines} lines of lyrics. Your job:
 1. Add TIMESTAMPS for EVERY line (when it is sung)
@@ -308,10 +506,15 @@ CRITICAL:
         
         payload = {
             "contents": [{"parts": [
-                {"inlineData": {"mimeType": mime_type, "data": audio_b64}},
+                audio_part,
                 {"text": prompt}
             ]}],
-            "generationConfig": {"temperature": 0.1, "maxOutputTokens": 65536}
+            "generationConfig": {
+                "temperature": 0.1,
+                "maxOutputTokens": 65536,
+                "responseMimeType": "application/json",
+                "responseSchema": _SEGMENTS_SCHEMA,
+            }
         }
         
         try:
@@ -320,59 +523,51 @@ CRITICAL:
                 print(f"  {model_name}: HTTP {response.status_code}", flush=True)
                 continue
             
-            result = response.json()
-            parts = result["candidates"][0]["content"]["parts"]
-            all_texts = [p["text"] for p in parts if "text" in p]
-            text_response = all_texts[-1] if all_texts else ""
+            result = _loads(response.content)
+            text_response = _last_text_part(result["candidates"][0]["content"]["parts"])
             
             if not text_response:
                 continue
             
-            # Parse JSON
-            try:
-                data = json.loads(text_response.strip())
-            except json.JSONDecodeError:
-                stripped = text_response.replace("```json", "").replace("```", "").strip()
-                try:
-                    data = json.loads(stripped)
-                except json.JSONDecodeError:
-                    s, e = stripped.find("["), stripped.rfind("]")
-                    if s >= 0 and e > s:
-                        data = json.loads(stripped[s:e+1])
-                    else:
-                        print(f"  {model_name}: No JSON found", flush=True)
-                        continue
+            data = _loads(text_response)
             
             if not isinstance(data, list) or len(data) == 0:
                 continue
             
             # Validate: must have at least 80% of expected lines
             non_empty_count = sum(1 for item in data if item.get("text", "").strip())
+            if total_lines * 0.6 <= non_empty_count < total_lines * 0.8:
+                # Close miss — ask the same model to place only the skipped
+                # lines (text-only call, no audio re-upload)
+                print(f"  {model_name}: Only {non_empty_count}/{total_lines} lines. Requesting missing lines...", flush=True)
+                data = _fill_missing_lines(model_name, api_key, data, clean_lines, audio_duration)
+                non_empty_count = sum(1 for item in data if item.get("text", "").strip())
             if non_empty_count < total_lines * 0.8:
                 print(f"  {model_name}: Only {non_empty_count}/{total_lines} lines (need 80%). Trying next model...", flush=True)
                 continue
             
             # Clamp all timestamps to audio duration
             segments = []
+            max_ts = 0
             for item in data:
                 text = item.get("text", "")
                 start = min(max(item.get("start", 0), 0), audio_duration)
                 end = min(max(item.get("end", start + 0.1), start + 0.1), audio_duration)
+                max_ts = max(max_ts, end)
                 words = item.get("words", [])
                 
                 for w in words:
-                    w["start"] = round(max(start, min(w.get("start", start), end)), 2)
-                    w["end"] = round(max(w["start"] + 0.05, min(w.get("end", end), end)), 2)
+                    w["start"] = _q(max(start, min(w.get("start", start), end)))
+                    w["end"] = _q(max(w["start"] + 0.05, min(w.get("end", end), end)))
                     if w["end"] - w["start"] > 1.5:
-                        w["end"] = round(w["start"] + 1.5, 2)
+                        w["end"] = _q(w["start"] + 1.5)
                 
-                segments.append({"text": text, "start": round(start, 2), "end": round(end, 2), "words": words})
+                segments.append({"text": text, "start": _q(start), "end": _q(end), "words": words})
             
             segments = _transfer_punctuation(segments)
             
-            non_empty = [s for s in segments if s["text"].strip()]
-            max_ts = max(s["end"] for s in segments) if segments else 0
-            print(f"  SUCCESS: {len(segments)} segments ({len(non_empty)} with lyrics)", flush=True)
+            # non_empty_count was already tallied by the 80% coverage check above
+            print(f"  SUCCESS: {len(segments)} segments ({non_empty_count} with lyrics)", flush=True)
             print(f"  Max timestamp: {max_ts:.1f}s (audio: {audio_duration:.1f}s)", flush=True)
             
             for seg in segments[:3]:
@@ -414,17 +609,13 @@ def align_and_split_lyrics(audio_path, lyrics_segments, api_key=None):
         print(f"  WARNING: Audio file not found: {audio_path}")
         return lyrics_segments
     
-    audio_bytes = audio_path.read_bytes()
-    audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
-    
-    ext = audio_path.suffix.lower()
-    mime_map = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".m4a": "audio/mp4"}
-    mime_type = mime_map.get(ext, "audio/mpeg")
+    audio_part = _inline_audio_part(audio_path)
     
     # Build segment info
-    seg_info = ""
-    for i, seg in enumerate(lyrics_segments):
-        seg_info += f'Segment {i}: [{seg["start"]:.2f}s - {seg["end"]:.2f}s] "{seg["text"]}"\n'
+    seg_info = "".join(
+        f'Segment {i}: [{seg["start"]:.2f}s - {seg["end"]:.2f}s] "{seg["text"]}"\n'
+        for i, seg in enumerate(lyrics_segments)
+    )
     
     prompt = f"""You are an audio-to-lyrics alignment tool. I'm giving you an audio file and lyrics with FIXED segment timing.
 
@@ -464,12 +655,14 @@ Return ONLY the JSON array:"""
         
         payload = {
             "contents": [{"parts": [
-                {"inlineData": {"mimeType": mime_type, "data": audio_b64}},
+                audio_part,
                 {"text": prompt}
             ]}],
             "generationConfig": {
                 "temperature": 0.1,
                 "maxOutputTokens": 65536,
+                "responseMimeType": "application/json",
+                "responseSchema": _ALIGN_SPLIT_SCHEMA,
             }
         }
         
@@ -480,30 +673,14 @@ Return ONLY the JSON array:"""
                 print(f"  {model_name} failed: HTTP {response.status_code}", flush=True)
                 continue
             
-            result = response.json()
-            parts = result["candidates"][0]["content"]["parts"]
-            all_texts = [p["text"] for p in parts if "text" in p]
-            text_response = all_texts[-1] if all_texts else ""
+            result = _loads(response.content)
+            text_response = _last_text_part(result["candidates"][0]["content"]["parts"])
             
             if not text_response:
                 print(f"  {model_name}: No text in response", flush=True)
                 continue
             
-            # Parse JSON — handle code fences
-            try:
-                data = json.loads(text_response.strip())
-            except json.JSONDecodeError:
-                stripped = text_response.replace("```json", "").replace("```", "").strip()
-                try:
-                    data = json.loads(stripped)
-                except json.JSONDecodeError:
-                    idx_s = stripped.find("[")
-                    idx_e = stripped.rfind("]")
-                    if idx_s >= 0 and idx_e > idx_s:
-                        data = json.loads(stripped[idx_s:idx_e+1])
-                    else:
-                        print(f"  {model_name}: No JSON found", flush=True)
-                        continue
+            data = _loads(text_response)
             
             if not isinstance(data, list) or len(data) == 0:
                 print(f"  {model_name}: Empty response", flush=True)
@@ -528,6 +705,7 @@ Return ONLY the JSON array:"""
                     dur = seg["end"] - seg["start"]
                     rep_dur = dur / reps
                     print(f"  Seg {i}: \"{seg['text'][:35]}\" → {reps}x ({rep_dur:.1f}s each)", flush=True)
+                    tokens = seg["text"].split()
                     
                     for r in range(reps):
                         rep_start = round(seg["start"] + r * rep_dur, 2)
@@ -538,7 +716,7 @@ Return ONLY the JSON array:"""
                             words = _clamp_words(gemini_words, rep_start, rep_end)
                         else:
                             # Even distribution for subsequent repetitions
-                            words = _even_words(seg["text"], rep_start, rep_end)
+                            words = _even_words_from_tokens(tokens, rep_start, rep_end)
                         
                         expanded.append({
                             "text": seg["text"],
@@ -575,29 +753,35 @@ Return ONLY the JSON array:"""
 
 def _clamp_words(gemini_words, seg_start, seg_end):
     """Clamp word timestamps into segment boundaries and cap duration."""
-    clamped = []
-    for w in gemini_words:
-        ws = max(seg_start, min(w["start"], seg_end))
-        we = max(ws + 0.05, min(w["end"], seg_end))
-        if we - ws > 1.5:
-            we = round(ws + 1.5, 2)
-        clamped.append({"word": w["word"], "start": round(ws, 2), "end": round(we, 2)})
-    clamped.sort(key=lambda w: w["start"])
-    return clamped
+    if not gemini_words:
+        return []
+    starts = np.fromiter((w["start"] for w in gemini_words), dtype=np.float64, count=len(gemini_words))
+    ends = np.fromiter((w["end"] for w in gemini_words), dtype=np.float64, count=len(gemini_words))
+    starts = np.maximum(seg_start, np.minimum(starts, seg_end))
+    ends = np.maximum(starts + 0.05, np.minimum(ends, seg_end))
+    # Cap word duration to 1.5s
+    ends = np.minimum(ends, starts + 1.5)
+    starts = _q_array(starts)
+    ends = _q_array(ends)
+    order = np.argsort(starts, kind="stable")
+    return [{"word": gemini_words[i]["word"], "start": float(starts[i]), "end": float(ends[i])}
+            for i in order]
 
 
 def _even_words(text, start, end):
     """Create evenly distributed word timestamps, preserving punctuation."""
     # Split but keep punctuation attached to words
-    import re
-    text_words = re.findall(r'\S+', text)
-    text_words = [w.strip() for w in text_words if w.strip()]
-    n = max(len(text_words), 1)
+    return _even_words_from_tokens(text.split(), start, end)
+
+
+def _even_words_from_tokens(tokens, start, end):
+    """Evenly distribute already-split word tokens across [start, end]."""
+    n = max(len(tokens), 1)
     dur = end - start
     slot = dur / n
-    return [{"word": tw, "start": round(start + j * slot, 2),
-             "end": round(start + (j + 1) * slot - 0.03, 2)}
-            for j, tw in enumerate(text_words)]
+    return [{"word": tw, "start": _q(start + j * slot),
+             "end": _q(start + (j + 1) * slot - 0.03)}
+            for j, tw in enumerate(tokens)]
 
 
 def _transfer_punctuation(segments):
@@ -615,42 +799,61 @@ def _transfer_punctuation(segments):
         if not text or not words:
             continue
         
-        # Split text into tokens preserving punctuation
-        import re
-        text_tokens = re.findall(r'\S+', text)
-        
-        # Match words to text tokens
-        ti = 0  # text token index
-        for w in words:
-            clean_word = w["word"].rstrip(",!।.?")
-            # Find matching text token
-            while ti < len(text_tokens):
-                clean_token = text_tokens[ti].rstrip(",!।.?")
-                if clean_token == clean_word:
+        # Gemini usually follows the prompt and keeps punctuation on the
+        # words already — only fall back to matching against the text if not
+        if not any(w["word"] and w["word"][-1] in ",!।.?" for w in words):
+            # Split text into tokens preserving punctuation, and index them by
+            # their bare form so each word is matched with one lookup
+            text_tokens = text.split()
+            token_positions = {}
+            for i, token in enumerate(text_tokens):
+                token_positions.setdefault(token.rstrip(",!।.?"), []).append(i)
+            
+            # Match words to text tokens, never moving backwards in the text
+            cursor = 0
+            for w in words:
+                positions = token_positions.get(w["word"].rstrip(",!।.?"))
+                if not positions:
+                    continue
+                k = bisect_left(positions, cursor)
+                if k < len(positions):
                     # Transfer the full token (with punctuation) to the word
-                    w["word"] = text_tokens[ti]
-                    ti += 1
-                    break
-                ti += 1
+                    w["word"] = text_tokens[positions[k]]
+                    cursor = positions[k] + 1
         
         # Clean double punctuation: only keep one trailing symbol per word
         for w in words:
             word = w["word"]
-            # Count trailing punctuation chars
-            punct_chars = ""
-            while word and word[-1] in ",!।.?|":
-                punct_chars = word[-1] + punct_chars
-                word = word[:-1]
-            if len(punct_chars) > 1:
+            base = word.rstrip(",!।.?|")
+            if len(word) - len(base) > 1:
                 # Keep only the first (most important) punctuation
-                w["word"] = word + punct_chars[0]
+                w["word"] = word[:len(base) + 1]
         
         # Also clean segment text
-        seg["text"] = seg["text"].replace("!,", "!").replace(",!", "!").replace(",।", "।").replace("।,", "।")
+        seg["text"] = _PUNCT_RUN_RE.sub(_collapse_punct_run, seg["text"])
     
     return segments
 
 
+# Static repetition-detection instructions (systemInstruction keeps the request
+# prefix identical across songs; only the audio and segment list vary)
+_REPETITIONS_SYSTEM_PROMPT = """Listen to the audio carefully. You are given lyrics segments with timing.
+Some segments may contain a line that is REPEATED multiple times (chorus/refrain).
+
+For EACH segment, count how many times the text is actually sung in that time range.
+- If the line is sung once, count = 1
+- If the line is a repeated chorus sung 2, 3, 4, or more times in that time range, give the actual count
+- Pay attention to how many distinct vocal repetitions you hear in that segment's time range
+
+Return a JSON array with one object per segment:
+[
+  {"seg_index": 0, "repetitions": 1},
+  {"seg_index": 1, "repetitions": 1},
+  {"seg_index": 2, "repetitions": 2},
+  ...
+]"""
+
+
 def detect_chorus_repetitions(audio_path, lyrics_segments, api_key=None):
     """
     Use Gemini to detect how many times each line is actually repeated in the audio.
@@ -676,50 +879,31 @@ def detect_chorus_repetitions(audio_path, lyrics_segments, api_key=None):
         print(f"  WARNING: Audio file not found: {audio_path}")
         return lyrics_segments
     
-    audio_bytes = audio_path.read_bytes()
-    audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
-    
-    ext = audio_path.suffix.lower()
-    mime_map = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".m4a": "audio/mp4"}
-    mime_type = mime_map.get(ext, "audio/mpeg")
+    audio_part = _inline_audio_part(audio_path)
     
     # Build segment info for Gemini
-    seg_info = ""
-    for i, seg in enumerate(lyrics_segments):
-        dur = seg["end"] - seg["start"]
-        seg_info += f'Segment {i}: [{seg["start"]:.1f}s-{seg["end"]:.1f}s] ({dur:.1f}s) "{seg["text"]}"\n'
+    seg_info = "".join(
+        f'Segment {i}: [{seg["start"]:.1f}s-{seg["end"]:.1f}s] ({seg["end"] - seg["start"]:.1f}s) "{seg["text"]}"\n'
+        for i, seg in enumerate(lyrics_segments)
+    )
     
-    prompt = f"""Listen to this audio carefully. I have lyrics segments with timing below.
-Some segments may contain a line that is REPEATED multiple times (chorus/refrain).
-
-SEGMENTS:
+    prompt = f"""SEGMENTS:
 {seg_info}
-
-For EACH segment, count how many times the text is actually sung in that time range.
-- If the line is sung once, count = 1
-- If the line is a repeated chorus sung 2, 3, 4, or more times in that time range, give the actual count
-- Pay attention to how many distinct vocal repetitions you hear in that segment's time range
-
-Return a JSON array with one object per segment:
-[
-  {{"seg_index": 0, "repetitions": 1}},
-  {{"seg_index": 1, "repetitions": 1}},
-  {{"seg_index": 2, "repetitions": 2}},
-  ...
-]
-
 Return ONLY the JSON array:"""
 
     url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
     
     payload = {
+        "systemInstruction": {"parts": [{"text": _REPETITIONS_SYSTEM_PROMPT}]},
         "contents": [{"parts": [
-            {"inlineData": {"mimeType": mime_type, "data": audio_b64}},
+            audio_part,
             {"text": prompt}
         ]}],
         "generationConfig": {
             "temperature": 0.1,
             "maxOutputTokens": 4096,
+            "responseMimeType": "application/json",
+            "responseSchema": _REPETITIONS_SCHEMA,
         }
     }
     
@@ -732,41 +916,23 @@ Return ONLY the JSON array:"""
             print(f"  Failed: HTTP {response.status_code}", flush=True)
             return lyrics_segments
         
-        result = response.json()
+        result = _loads(response.content)
         
         # Collect ALL text from all parts
         parts = result["candidates"][0]["content"]["parts"]
-        all_texts = [p["text"] for p in parts if "text" in p]
         # Use the last text part (thinking block is usually first)
-        text_response = all_texts[-1] if all_texts else ""
+        text_response = _last_text_part(parts)
         
         if not text_response:
             print(f"  No text found in response (parts: {len(parts)})", flush=True)
             return lyrics_segments
         
-        # Extract JSON array — handle ```json ... ``` wrapping
         try:
-            # Try direct JSON parse first
-            rep_data = json.loads(text_response.strip())
-        except json.JSONDecodeError:
-            # Strip code fences and find JSON array
-            stripped = text_response.replace("```json", "").replace("```", "").strip()
-            try:
-                rep_data = json.loads(stripped)
-            except json.JSONDecodeError:
-                # Last resort: find [ and ] and extract
-                idx_start = stripped.find("[")
-                idx_end = stripped.rfind("]")
-                if idx_start >= 0 and idx_end > idx_start:
-                    try:
-                        rep_data = json.loads(stripped[idx_start:idx_end+1])
-                    except json.JSONDecodeError as e:
-                        print(f"  JSON parse failed: {e}", flush=True)
-                        print(f"  Text preview: {stripped[:200]}", flush=True)
-                        return lyrics_segments
-                else:
-                    print(f"  No JSON array found in response", flush=True)
-                    return lyrics_segments
+            rep_data = _loads(text_response)
+        except json.JSONDecodeError as e:
+            print(f"  JSON parse failed: {e}", flush=True)
+            print(f"  Text preview: {text_response[:200]}", flush=True)
+            return lyrics_segments
         
         # Build repetition map
         rep_map = {}
@@ -784,22 +950,22 @@ Return ONLY the JSON array:"""
                 dur = seg["end"] - seg["start"]
                 rep_dur = dur / reps
                 print(f"  Seg {i}: \"{seg['text'][:40]}\" → {reps} repetitions ({rep_dur:.1f}s each)", flush=True)
+                # Even word timestamps within each repetition, computed for
+                # all repetitions × words at once
+                text_words = seg["text"].translate(_WORD_SEP_TABLE).split()
+                word_slot = rep_dur / max(len(text_words), 1)
+                rep_bounds = _q_array(seg["start"] + np.arange(reps + 1) * rep_dur)
+                offsets = np.arange(len(text_words)) * word_slot
+                word_starts = _q_array(rep_bounds[:-1, None] + offsets[None, :]).tolist()
+                word_ends = _q_array(rep_bounds[:-1, None] + (offsets + word_slot - 0.03)[None, :]).tolist()
+                rep_bounds = rep_bounds.tolist()
                 for r in range(reps):
-                    rep_start = round(seg["start"] + r * rep_dur, 2)
-                    rep_end = round(seg["start"] + (r + 1) * rep_dur, 2)
-                    # Create even word timestamps within each repetition
-                    text_words = seg["text"].replace(",", " ").replace("।", " ").split()
-                    text_words = [w.strip() for w in text_words if w.strip()]
-                    n = len(text_words)
-                    word_slot = rep_dur / max(n, 1)
-                    words = [{"word": tw, "start": round(rep_start + j * word_slot, 2), 
-                              "end": round(rep_start + (j + 1) * word_slot - 0.03, 2)}
-                             for j, tw in enumerate(text_words)]
                     expanded.append({
                         "text": seg["text"],
-                        "start": rep_start,
-                        "end": rep_end,
-                        "words": words
+                        "start": rep_bounds[r],
+                        "end": rep_bounds[r + 1],
+                        "words": [{"word": tw, "start": ws, "end": we}
+                                  for tw, ws, we in zip(text_words, word_starts[r], word_ends[r])]
                     })
             else:
                 expanded.append(seg)
@@ -818,13 +984,14 @@ def main():
     parser.add_argument("--audio", required=True, help="Path to audio file")
     parser.add_argument("--lyrics", required=True, help="Path to lyrics.json")
     parser.add_argument("--output", help="Output path (default: overwrites lyrics)")
+    parser.add_argument("--pretty", action="store_true", help="Indent the output JSON (default: compact)")
     args = parser.parse_args()
     
     from dotenv import load_dotenv
     load_dotenv()
     
-    with open(args.lyrics, 'r', encoding='utf-8') as f:
-        lyrics = json.load(f)
+    with open(args.lyrics, 'rb') as f:
+        lyrics = _loads(f.read())
     
     print(f"--- Gemini Forced Alignment ---")
     print(f"Audio: {args.audio}")
@@ -834,7 +1001,7 @@ def main():
     
     output_path = args.output or args.lyrics
     with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(aligned, f, ensure_ascii=False, indent=2)
+        f.write(_dumps(aligned, indent=args.pretty))
     
     print(f"\nSaved to {output_path}")
     print(f"Total segments: {len(aligned)}")
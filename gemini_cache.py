@@ -0,0 +1,90 @@
+"""
+Gemini Response Cache
+=====================
+Small content-addressed on-disk cache for Gemini results, so re-running the
+pipeline on the same song does not repeat slow API round-trips.
+
+Entries live under ~/.cache/audio_to_video_maker/<namespace>/<sha256[:2]>/<sha256>.json
+(root overridable with LYRIC_CACHE_DIR) and are written atomically; the
+two-character shard keeps directories small as the cache grows. A per-process
+LRU memo avoids re-reading hot entries, so cached values must be treated as
+read-only by callers.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+CACHE_ROOT = Path(os.environ.get("LYRIC_CACHE_DIR") or Path.home() / ".cache" / "audio_to_video_maker").expanduser()
+
+
+def cache_key(*parts) -> str:
+    """SHA-256 hex digest over the given string parts."""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def file_digest(path) -> str:
+    """SHA-256 hex digest of a file's contents (e.g. the song audio)."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _entry_path(namespace: str, key: str) -> Path:
+    return CACHE_ROOT / namespace / key[:2] / f"{key}.json"
+
+
+@lru_cache(maxsize=256)
+def _read_entry(path: str, mtime_ns: int):
+    # mtime_ns is part of the memo key so a rewritten entry is re-read
+    with open(path, "rb") as f:
+        return json.loads(f.read())
+
+
+def cache_get(namespace: str, key: str, ttl: float = None):
+    """
+    Return the cached value for key, or None on a miss.
+    Entries older than ttl seconds (when given) count as a miss.
+    """
+    path = _entry_path(namespace, key)
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    if ttl is not None and time.time() - st.st_mtime > ttl:
+        return None
+    try:
+        return _read_entry(str(path), st.st_mtime_ns)
+    except (OSError, ValueError):
+        return None
+
+
+def cache_put(namespace: str, key: str, value) -> None:
+    """Atomically store a JSON-serializable value. Write failures are non-fatal."""
+    path = _entry_path(namespace, key)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"  WARNING: Could not write cache entry {path}: {e}", flush=True)
+
+
+def cached_call(namespace: str, key: str, fn, *args, ttl: float = None, **kwargs):
+    """
+    Return the cached value for key, or call fn(*args, **kwargs) and cache
+    its result. Falsy results (None, []) are treated as failures and not cached.
+    """
+    value = cache_get(namespace, key, ttl=ttl)
+    if value is not None:
+        print(f"  Using cached {namespace} result", flush=True)
+        return value
+    value = fn(*args, **kwargs)
+    if value:
+        cache_put(namespace, key, value)
+    return value
@@ -5,31 +5,29 @@ based on the song's title and lyrics using Gemini API.
 """
 
 import os
-import json
 import base64
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+from json_utils import _loads
 
-def analyze_song_topic(song_name: str, lyrics_text: str, api_key: str = None) -> str:
-    """
-    Uses Gemini text API to analyze the song and generate
-    an image prompt describing the ideal background.
-    """
-    key = api_key or os.environ.get("GEMINI_API_KEY")
-    if not key:
-        print("Error: No GEMINI_API_KEY found for image prompt generation.")
-        return None
+try:
+    import ijson  # optional: incremental parsing of large image responses
+except ImportError:
+    ijson = None
 
-    # Take first 500 chars of lyrics for context
-    lyrics_preview = lyrics_text[:500] if lyrics_text else ""
+# One keep-alive session for all Gemini/Imagen calls: the model fallback
+# loop and the Imagen fallback reuse the same TLS connection.
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4))
 
-    prompt = f"""You are a visual art director for Indian devotional music videos.
 
-Given this song information, generate a SHORT image prompt (max 2 sentences) describing the perfect background image for a lyric video.
+# Static art-director instructions, sent as systemInstruction so every request
+# shares an identical prefix; only the song title/lyrics vary.
+_TOPIC_SYSTEM_PROMPT = """You are a visual art director for Indian devotional music videos.
 
-Song Title: {song_name}
-Lyrics Preview: {lyrics_preview}
+Given song information, generate a SHORT image prompt (max 2 sentences) describing the perfect background image for a lyric video.
 
 RULES:
 1. Identify the deity or spiritual theme (Shiva, Krishna, Ganesh, Ram, Hanuman, Durga, etc.)
@@ -41,18 +39,66 @@ RULES:
 
 Return ONLY the image prompt text, nothing else."""
 
+# Base64 slice decoded per write (a multiple of 4, so slices decode independently)
+_B64_CHUNK = 64 * 1024
+
+# Cached image prompts are reused for 30 days
+_TOPIC_CACHE_TTL = 30 * 86400
+
+
+def _iter_response_parts(response):
+    """
+    Yield the content parts of a streamed generateContent response.
+    With ijson installed the body is parsed incrementally, so the multi-MB
+    base64 image is never held alongside a full parsed copy of the response.
+    """
+    if ijson is not None:
+        response.raw.decode_content = True
+        yield from ijson.items(response.raw, "candidates.item.content.parts.item")
+        return
+    candidates = _loads(response.content).get('candidates', [])
+    if candidates:
+        yield from candidates[0].get('content', {}).get('parts', [])
+
+
+def analyze_song_topic(song_name: str, lyrics_text: str, api_key: str = None) -> str:
+    """
+    Uses Gemini text API to analyze the song and generate
+    an image prompt describing the ideal background.
+    Prompts are cached on disk per song title + lyrics preview.
+    """
+    key = api_key or os.environ.get("GEMINI_API_KEY")
+    if not key:
+        print("Error: No GEMINI_API_KEY found for image prompt generation.")
+        return None
+
+    # Take first 500 chars of lyrics for context
+    lyrics_preview = lyrics_text[:500] if lyrics_text else ""
+
+    from gemini_cache import cache_key, cache_get, cache_put
+    topic_key = cache_key("gemini-2.5-flash", song_name, lyrics_preview)
+    cached = cache_get("topic", topic_key, ttl=_TOPIC_CACHE_TTL)
+    if cached is not None:
+        print(f"Using cached image prompt: {cached}")
+        return cached
+
+    prompt = f"""Song Title: {song_name}
+Lyrics Preview: {lyrics_preview}"""
+
     url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={key}"
     headers = {"Content-Type": "application/json"}
     data = {
+        "systemInstruction": {"parts": [{"text": _TOPIC_SYSTEM_PROMPT}]},
         "contents": [{"parts": [{"text": prompt}]}],
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response = _SESSION.post(url, headers=headers, json=data, timeout=30)
         if response.status_code == 200:
-            result = response.json()
+            result = _loads(response.content)
             image_prompt = result['candidates'][0]['content']['parts'][0]['text'].strip()
             print(f"Generated image prompt: {image_prompt}")
+            cache_put("topic", topic_key, image_prompt)
             return image_prompt
         else:
             print(f"Gemini text API failed: {response.status_code}")
@@ -62,12 +108,91 @@ Return ONLY the image prompt text, nothing else."""
         return None
 
 
+def _write_base64(b64: str, path: Path) -> int:
+    """
+    Decode base64 image data straight into a file, a slice at a time, so the
+    decoded image is never held in memory next to its base64 text.
+    Returns the number of bytes written.
+    """
+    size = 0
+    with open(path, 'wb') as f:
+        for i in range(0, len(b64), _B64_CHUNK):
+            size += f.write(base64.b64decode(b64[i:i + _B64_CHUNK]))
+    return size
+
+
+def _request_image(model_name: str, image_prompt: str, key: str):
+    """
+    Ask one Gemini image model for a background image.
+    Returns the response's inlineData part ({"mimeType", "data"}) or None.
+    """
+    print(f"Attempting image generation with {model_name}...")
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={key}"
+    headers = {"Content-Type": "application/json"}
+    data = {
+        "contents": [{
+            "parts": [{
+                "text": f"Generate a high quality, cinematic background image: {image_prompt}. The image should be dark and moody, 1920x1080 landscape orientation, suitable for overlaying white text on top."
+            }]
+        }],
+        "generationConfig": {
+            "responseModalities": ["IMAGE", "TEXT"],
+            "responseMimeType": "text/plain",
+        }
+    }
+
+    try:
+        response = _SESSION.post(url, headers=headers, json=data, timeout=120, stream=True)
+        if response.status_code == 200:
+            with response:
+                for part in _iter_response_parts(response):
+                    if 'inlineData' in part:
+                        # Found image data
+                        return part['inlineData']
+
+            print(f"No image data in response from {model_name}")
+        else:
+            print(f"Model {model_name} failed: {response.status_code} - {response.text[:200]}")
+    except Exception as e:
+        print(f"Error with {model_name}: {e}")
+    return None
+
+
+def _save_inline_image(inline: dict, output_path: Path) -> None:
+    """Decode an inlineData image part and write it to output_path."""
+    mime_type = inline.get('mimeType', 'image/png')
+
+    # Determine extension
+    ext = '.png' if 'png' in mime_type else '.jpg'
+    final_path = output_path.with_suffix(ext)
+
+    size = _write_base64(inline['data'], final_path)
+
+    # If the extension changed, also expose the image at the expected path.
+    # Downstream only reads it, so a link is enough; copy as a last resort.
+    # A previous run may have left the link (or another image) there.
+    if str(final_path) != str(output_path) and not (
+            output_path.exists() and os.path.samefile(final_path, output_path)):
+        output_path.unlink(missing_ok=True)
+        try:
+            os.link(final_path, output_path)
+        except (OSError, NotImplementedError):
+            try:
+                os.symlink(final_path.resolve(), output_path, target_is_directory=False)
+            except (OSError, NotImplementedError):
+                import shutil
+                shutil.copy2(str(final_path), str(output_path))
+
+    print(f"SUCCESS: Background image saved to {output_path} ({size} bytes)")
+
+
 def generate_background_image(song_name: str, lyrics_text: str, output_path: str, api_key: str = None) -> bool:
     """
     Generates a background image for the lyric video using Gemini's image generation.
     
     1. Analyzes the song to determine the topic/deity
     2. Generates an image using Gemini imagen API
+       (models tried in order, or raced when GEMINI_IMAGE_RACE=1)
     3. Saves it to output_path
     
     Returns True on success, False on failure.
@@ -103,55 +228,26 @@ def generate_background_image(song_name: str, lyrics_text: str, output_path: str
         "gemini-2.0-flash-exp-image-generation",
     ]
 
-    for model_name in models_to_try:
-        print(f"Attempting image generation with {model_name}...")
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={key}"
-        headers = {"Content-Type": "application/json"}
-        data = {
-            "contents": [{
-                "parts": [{
-                    "text": f"Generate a high quality, cinematic background image: {image_prompt}. The image should be dark and moody, 1920x1080 landscape orientation, suitable for overlaying white text on top."
-                }]
-            }],
-            "generationConfig": {
-                "responseModalities": ["IMAGE", "TEXT"],
-                "responseMimeType": "text/plain",
-            }
-        }
-
+    if os.environ.get("GEMINI_IMAGE_RACE") == "1":
+        # Opt-in: query every model at once and keep the first image back.
+        # Faster when the Pro model is slow, but every request is billed.
+        print(f"Racing image generation across {len(models_to_try)} models...")
+        pool = ThreadPoolExecutor(max_workers=len(models_to_try))
+        futures = [pool.submit(_request_image, m, image_prompt, key) for m in models_to_try]
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=120)
-            if response.status_code == 200:
-                result = response.json()
-                candidates = result.get('candidates', [])
-                if candidates:
-                    parts = candidates[0].get('content', {}).get('parts', [])
-                    for part in parts:
-                        if 'inlineData' in part:
-                            # Found image data
-                            image_data = base64.b64decode(part['inlineData']['data'])
-                            mime_type = part['inlineData'].get('mimeType', 'image/png')
-
-                            # Determine extension
-                            ext = '.png' if 'png' in mime_type else '.jpg'
-                            final_path = output_path.with_suffix(ext)
-
-                            with open(final_path, 'wb') as f:
-                                f.write(image_data)
-
-                            # If the extension changed, also copy to the expected path
-                            if str(final_path) != str(output_path):
-                                import shutil
-                                shutil.copy2(str(final_path), str(output_path))
-
-                            print(f"SUCCESS: Background image saved to {output_path} ({len(image_data)} bytes)")
-                            return True
-
-                    print(f"No image data in response from {model_name}")
-            else:
-                print(f"Model {model_name} failed: {response.status_code} - {response.text[:200]}")
-        except Exception as e:
-            print(f"Error with {model_name}: {e}")
+            for future in as_completed(futures):
+                inline = future.result()
+                if inline:
+                    _save_inline_image(inline, output_path)
+                    return True
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        for model_name in models_to_try:
+            inline = _request_image(model_name, image_prompt, key)
+            if inline:
+                _save_inline_image(inline, output_path)
+                return True
 
     # Step 3: Fallback — try Imagen API
     print("Trying Imagen 3 API as fallback...")
@@ -164,14 +260,12 @@ def generate_background_image(song_name: str, lyrics_text: str, output_path: str
                 "aspectRatio": "16:9",
             }
         }
-        response = requests.post(imagen_url, headers=headers, json=imagen_data, timeout=120)
+        response = _SESSION.post(imagen_url, headers={"Content-Type": "application/json"}, json=imagen_data, timeout=120)
         if response.status_code == 200:
-            result = response.json()
+            result = _loads(response.content)
             predictions = result.get('predictions', [])
             if predictions and 'bytesBase64Encoded' in predictions[0]:
-                image_data = base64.b64decode(predictions[0]['bytesBase64Encoded'])
-                with open(output_path, 'wb') as f:
-                    f.write(image_data)
+                _write_base64(predictions[0]['bytesBase64Encoded'], output_path)
                 print(f"SUCCESS (Imagen): Background image saved to {output_path}")
                 return True
             else:
@@ -188,8 +282,8 @@ def generate_background_image(song_name: str, lyrics_text: str, output_path: str
 def get_lyrics_text_from_json(lyrics_path: str) -> str:
     """Extract plain text from lyrics.json for analysis."""
     try:
-        with open(lyrics_path, 'r', encoding='utf-8') as f:
-            lyrics = json.load(f)
+        with open(lyrics_path, 'rb') as f:
+            lyrics = _loads(f.read())
         return " ".join([seg.get("text", "") for seg in lyrics if seg.get("text")])
     except Exception:
         return ""
@@ -0,0 +1,44 @@
+"""
+JSON helpers
+============
+One place for the optional orjson fast path used across the pipeline.
+Without orjson the standard library produces the same text, so anything
+derived from it (e.g. Gemini cache keys) does not depend on what is installed.
+"""
+
+import json
+
+try:
+    import orjson  # optional: faster JSON encode/decode
+except ImportError:
+    orjson = None
+
+
+def _loads(data):
+    """Parse a JSON document (str or bytes), with orjson when installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(data, sort_keys=False, indent=False):
+    """
+    Encode data as compact JSON text (sorted keys / 2-space indent on request),
+    with orjson when installed. Both paths give the same text.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option).decode("utf-8")
+    if indent:
+        return json.dumps(data, ensure_ascii=False, sort_keys=sort_keys, indent=2)
+    return json.dumps(data, ensure_ascii=False, sort_keys=sort_keys, separators=(",", ":"))
+
+
+def _write_json(path, data):
+    """Write data as indented UTF-8 JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(_dumps(data, indent=True))
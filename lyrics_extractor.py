@@ -7,13 +7,25 @@ Strategy:
 2. Strip section markers like [Verse 1], [Chorus], [Intro], [Outro], etc.
 3. Strip stage directions in parentheses like (Rhythmic harmonium opening...)
 4. Keep only lines containing Devanagari Unicode characters (U+0900–U+097F)
-5. Deduplicate consecutive identical lines (keep max 2 repeats for choruses)
+5. Keep repeated lines as-is (alignment needs every sung repetition)
 6. Use Gemini API to add punctuation (, ! ।) without changing text
 """
 
 import re
 import os
 import json
+import mmap
+from functools import lru_cache
+
+from json_utils import _loads
+
+# Line filters, compiled once
+_RE_INLINE_SECTION = re.compile(r'\[.*?\]\s*')
+_RE_INLINE_PAREN = re.compile(r'\(.*?\)')
+_RE_SUNO_END = re.compile(r'^(Cover Art|Raw API|Audio URL|Image URL|Generated|Metadata)')
+
+# Devanagari block (U+0900–U+097F) as a set of characters
+_DEVA_CHARS = frozenset(map(chr, range(0x0900, 0x0980)))
 
 
 def extract_lyrics_from_text(raw_text: str) -> str:
@@ -32,100 +44,179 @@ def extract_lyrics_from_text(raw_text: str) -> str:
     if not raw_text or not raw_text.strip():
         return ""
     
-    lines = raw_text.split("\n")
-    
-    # --- Step 1: Try to extract the "--- Lyrics ---" section (Suno AI format) ---
-    lyrics_section = _extract_suno_lyrics_section(lines)
-    if lyrics_section:
-        lines = lyrics_section
+    return _extract_lyrics_from_lines(raw_text.split("\n"))
+
+
+def extract_lyrics_from_file(path) -> str:
+    """
+    Same as extract_lyrics_from_text, but streams the file line by line
+    through a read-only mmap instead of decoding it into one big string.
+    Multi-MB Suno raw-API dumps are mostly non-lyric lines that get dropped
+    as soon as they are read.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _extract_lyrics_from_lines(_mmap_lines(mm))
+
+
+def _mmap_lines(mm):
+    """Yield decoded lines like str.split('\\n') would, without reading all at once."""
+    # '\n' never occurs inside a multi-byte UTF-8 sequence, so each
+    # line decodes on its own
+    for line in iter(mm.readline, b""):
+        yield line.decode("utf-8")
+    if mm[-1:] == b"\n":
+        yield ""
+
+
+def _extract_lyrics_from_lines(lines) -> str:
+    """
+    Single pass over raw lines (any iterable of str).
     
-    # --- Step 2: Filter and clean each line ---
+    If the file has a Suno AI '--- Lyrics ---' section, only that part is
+    kept (up to the next '--- ... ---' header or metadata line); otherwise
+    every line is a candidate (file might be plain lyrics).
+    """
     clean_lines = []
-    for line in lines:
-        line = line.strip()
-        
-        # Skip empty lines
-        if not line:
-            continue
-        
-        # Skip section markers: [Verse 1], [Chorus], [Intro], [Bridge], etc.
-        if re.match(r'^\[.*\]$', line):
-            continue
-        
-        # Skip stage directions in parentheses: (Rhythmic harmonium opening...)
-        if re.match(r'^\(.*\)$', line):
-            continue
-        
-        # Skip metadata lines (key: value format with no Devanagari)
-        if re.match(r'^[A-Za-z\s]+:', line) and not _has_devanagari(line):
-            continue
-        
-        # Skip URLs
-        if re.match(r'^https?://', line) or 'http' in line:
-            continue
-        
-        # Skip JSON-like lines
-        if line.startswith('{') or line.startswith('}') or line.startswith('"'):
-            continue
-        
-        # Skip lines that are purely ASCII/numbers (metadata, not lyrics)
-        if not _has_devanagari(line):
-            continue
+    section_start = None  # index into clean_lines where the lyrics section begins
+    section_len = 0       # raw lines seen inside the section
+    in_section = False
+    section_done = False
+    
+    for raw in lines:
+        stripped = raw.strip()
         
-        # Remove any inline section markers: [Verse 1] text here → text here
-        line = re.sub(r'\[.*?\]\s*', '', line).strip()
+        # Find start of lyrics section
+        if not section_done:
+            if stripped == "--- Lyrics ---":
+                section_start = len(clean_lines)
+                section_len = 0
+                in_section = True
+                continue
         
-        # Remove inline parenthetical directions
-        line = re.sub(r'\(.*?\)', '', line).strip()
+        # Find end of lyrics section (next --- section or metadata line)
+        if in_section:
+            if (stripped.startswith("---") and stripped.endswith("---") and len(stripped) > 6) \
+                    or _RE_SUNO_END.match(stripped):
+                if section_len:
+                    break
+                # Empty section: fall back to filtering the whole file
+                in_section = False
+                section_done = True
+                section_start = None
+            else:
+                section_len += 1
         
+        line = _clean_line(stripped)
         if line:
             clean_lines.append(line)
     
-    result = "\n".join(clean_lines)
+    if section_start is not None and section_len:
+        clean_lines = clean_lines[section_start:]
     
-    return result
+    return "\n".join(clean_lines)
 
 
-def _extract_suno_lyrics_section(lines: list) -> list | None:
-    """
-    If the file has a Suno AI '--- Lyrics ---' section, extract just that part.
-    Returns None if no such section is found (file might be plain lyrics).
-    """
-    lyrics_start = None
-    lyrics_end = None
+def _clean_line(line: str) -> str | None:
+    """Return the cleaned lyric text of a stripped line, or None to drop it."""
+    # Skip empty lines
+    if not line:
+        return None
     
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-        
-        # Find start of lyrics section
-        if stripped == "--- Lyrics ---":
-            lyrics_start = i + 1
-            continue
-        
-        # Find end of lyrics section (next --- section or metadata line)
-        if lyrics_start is not None and lyrics_end is None:
-            if stripped.startswith("---") and stripped.endswith("---") and len(stripped) > 6:
-                lyrics_end = i
-                break
-            # Also stop at "Cover Art URL:" or similar metadata
-            if re.match(r'^(Cover Art|Raw API|Audio URL|Image URL|Generated|Metadata)', stripped):
-                lyrics_end = i
-                break
+    # Lyrics must contain Devanagari; this alone rejects metadata,
+    # URLs, JSON and other ASCII-only lines, so test it first
+    if not _has_devanagari(line):
+        return None
+    
+    # Skip section markers: [Verse 1], [Chorus], [Intro], [Bridge], etc.
+    if line[0] == '[' and line[-1] == ']':
+        return None
+    
+    # Skip stage directions in parentheses: (Rhythmic harmonium opening...)
+    if line[0] == '(' and line[-1] == ')':
+        return None
     
-    if lyrics_start is not None:
-        if lyrics_end is None:
-            lyrics_end = len(lines)
-        return lines[lyrics_start:lyrics_end]
+    # Skip URLs (any line mentioning http, which covers http:// and https://)
+    if 'http' in line:
+        return None
     
-    return None
+    # Skip JSON-like lines
+    if line.startswith(('{', '}', '"')):
+        return None
+    
+    # Remove any inline section markers: [Verse 1] text here → text here
+    if '[' in line:
+        line = _RE_INLINE_SECTION.sub('', line).strip()
+    
+    # Remove inline parenthetical directions
+    if '(' in line:
+        line = _RE_INLINE_PAREN.sub('', line).strip()
+    
+    return line or None
 
 
 def _has_devanagari(text: str) -> bool:
     """Check if text contains any Devanagari Unicode characters (U+0900–U+097F)."""
-    return bool(re.search(r'[\u0900-\u097F]', text))
+    return not _DEVA_CHARS.isdisjoint(text)
+
+
+
+
+
+# Static instructions go in systemInstruction so every request shares an
+# identical prefix (eligible for Gemini's implicit prompt caching); only the
+# numbered lyrics change per song.
+_PUNCT_SYSTEM_PROMPT = """You are a Hindi/Devanagari punctuation expert. Add punctuation to the lyrics you are given.
+
+RULES:
+- DO NOT change any words, spelling, or order
+- DO NOT add or remove any lines
+- DO NOT transliterate — keep everything in Devanagari
+- Output exactly as many lines as the input has.
+- Only ONE punctuation mark per position (never combine like !,)
+
+PUNCTUATION TO ADD:
+- , (comma) at natural pauses within a line
+- ! after exclamatory/devotional phrases like जय, हर हर महादेव, ॐ नमः शिवाय, राधे राधे, गणपति बप्पा मोरया, भोलेनाथ, etc.
+- । (purna viram) at the end of complete verses/sentences
+
+Return ONLY a JSON array of strings, one per input line, in the same order:
+["line1 with punctuation", "line2 with punctuation", ...]"""
+
 
+_JSON_DECODER = json.JSONDecoder()
 
 
+def _parse_json_array(text):
+    """
+    Decode the first JSON array in a model response in a single pass,
+    ignoring anything before it (```json fences, prose) or after it.
+    Returns None if there is no '['. Raises JSONDecodeError on bad JSON.
+    """
+    idx = text.find("[")
+    if idx < 0:
+        return None
+    obj, _ = _JSON_DECODER.raw_decode(text, idx)
+    return obj
+
+
+@lru_cache(maxsize=1)
+def _http_session():
+    """Keep-alive session shared by the punctuation model fallback loop."""
+    import requests
+    return requests.Session()
+
+
+def _punct_cache_ttl() -> float | None:
+    """Max age in seconds of cached punctuation (GEMINI_PUNCT_CACHE_TTL; unset = forever)."""
+    ttl = os.environ.get("GEMINI_PUNCT_CACHE_TTL")
+    try:
+        return float(ttl) if ttl else None
+    except ValueError:
+        print(f"WARNING: Ignoring invalid GEMINI_PUNCT_CACHE_TTL={ttl!r}")
+        return None
 
 
 def add_punctuation_with_gemini(lyrics_text: str, api_key: str = None) -> str:
@@ -138,11 +229,11 @@ def add_punctuation_with_gemini(lyrics_text: str, api_key: str = None) -> str:
     - ! after exclamatory/devotional phrases
     - । (purna viram) at verse/sentence ends
     
+    Results are cached on disk per model + lyrics text (see gemini_cache.py).
+    
     Returns:
         Punctuated lyrics text, same format (one line per lyric line).
     """
-    import requests
-    
     api_key = api_key or os.environ.get("GEMINI_API_KEY")
     if not api_key:
         print("WARNING: No GEMINI_API_KEY found. Returning lyrics without punctuation.")
@@ -154,49 +245,51 @@ def add_punctuation_with_gemini(lyrics_text: str, api_key: str = None) -> str:
     lines = lyrics_text.strip().split("\n")
     total = len(lines)
     
+    # Already punctuated (e.g. hand-edited ground truth): nothing to add
+    marks = lyrics_text.count(",") + lyrics_text.count("!") + lyrics_text.count("।")
+    if marks >= total * 0.5:
+        print(f"  Punctuation already present ({marks} marks / {total} lines), skipping Gemini", flush=True)
+        return lyrics_text
+    
+    models = ["gemini-2.5-flash", "gemini-2.0-flash"]
+    
+    # Reuse a previous result for identical lyrics (disk + in-process memo)
+    from gemini_cache import cache_key, cache_get, cache_put
+    cache_ttl = _punct_cache_ttl()
+    cache_keys = {m: cache_key(m, lyrics_text.strip()) for m in models}
+    for model_name in models:
+        cached = cache_get("punct", cache_keys[model_name], ttl=cache_ttl)
+        if cached is not None:
+            print(f"  Using cached punctuation ({model_name})", flush=True)
+            return cached
+    
     # Number each line so Gemini preserves them all
-    numbered = "\n".join([f"L{i+1}: {line}" for i, line in enumerate(lines)])
+    numbered = "\n".join(f"L{i}: {line}" for i, line in enumerate(lines, 1))
     
-    prompt = f"""You are a Hindi/Devanagari punctuation expert. Add punctuation to these lyrics.
-
-RULES:
-- DO NOT change any words, spelling, or order
-- DO NOT add or remove any lines
-- DO NOT transliterate — keep everything in Devanagari
-- There are exactly {total} lines. Output exactly {total} lines.
-- Only ONE punctuation mark per position (never combine like !,)
-
-PUNCTUATION TO ADD:
-- , (comma) at natural pauses within a line
-- ! after exclamatory/devotional phrases like जय, हर हर महादेव, ॐ नमः शिवाय, राधे राधे, गणपति बप्पा मोरया, भोलेनाथ, etc.
-- । (purna viram) at the end of complete verses/sentences
+    prompt = f"""There are exactly {total} lines. Output exactly {total} lines.
 
 INPUT LYRICS ({total} lines):
 {numbered}
 
-Return ONLY a JSON array of {total} strings, one per line, in the same order:
-["line1 with punctuation", "line2 with punctuation", ...]
-
-Return ONLY the JSON array:"""
-    
-    models = ["gemini-2.5-flash", "gemini-2.0-flash"]
+Return ONLY the JSON array of {total} strings:"""
     
     for model_name in models:
         print(f"  Adding punctuation with {model_name}...", flush=True)
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={api_key}"
         
         payload = {
+            "systemInstruction": {"parts": [{"text": _PUNCT_SYSTEM_PROMPT}]},
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {"temperature": 0.1, "maxOutputTokens": 8192}
         }
         
         try:
-            response = requests.post(url, json=payload, timeout=60)
+            response = _http_session().post(url, json=payload, timeout=60)
             if response.status_code != 200:
                 print(f"  {model_name}: HTTP {response.status_code}", flush=True)
                 continue
             
-            result = response.json()
+            result = _loads(response.content)
             parts = result["candidates"][0]["content"]["parts"]
             all_texts = [p["text"] for p in parts if "text" in p]
             text_response = all_texts[-1] if all_texts else ""
@@ -204,20 +297,11 @@ Return ONLY the JSON array:"""
             if not text_response:
                 continue
             
-            # Parse JSON array
-            try:
-                data = json.loads(text_response.strip())
-            except json.JSONDecodeError:
-                stripped = text_response.replace("```json", "").replace("```", "").strip()
-                try:
-                    data = json.loads(stripped)
-                except json.JSONDecodeError:
-                    s, e = stripped.find("["), stripped.rfind("]")
-                    if s >= 0 and e > s:
-                        data = json.loads(stripped[s:e+1])
-                    else:
-                        print(f"  {model_name}: No JSON found", flush=True)
-                        continue
+            # Parse JSON array (tolerates code fences / leading prose)
+            data = _parse_json_array(text_response)
+            if data is None:
+                print(f"  {model_name}: No JSON found", flush=True)
+                continue
             
             if not isinstance(data, list):
                 print(f"  {model_name}: Response is not an array", flush=True)
@@ -241,6 +325,7 @@ Return ONLY the JSON array:"""
             
             result_text = "\n".join(cleaned)
             print(f"  SUCCESS: Punctuated {total} lines with {model_name}", flush=True)
+            cache_put("punct", cache_keys[model_name], result_text)
             
             # Show sample
             for i, (orig, punct) in enumerate(zip(lines[:3], cleaned[:3])):
@@ -270,11 +355,8 @@ if __name__ == "__main__":
     
     filepath = sys.argv[1]
     
-    with open(filepath, "r", encoding="utf-8") as f:
-        raw = f.read()
-    
     # Step 1: Extract clean lyrics
-    extracted = extract_lyrics_from_text(raw)
+    extracted = extract_lyrics_from_file(filepath)
     
     print("=" * 50)
     print("EXTRACTED LYRICS:")
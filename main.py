@@ -1,61 +1,151 @@
 import os
-import json
+import sys
 import shutil
 import subprocess
 import argparse
-from dotenv import load_dotenv
-load_dotenv()
-
-from nemo_align import align_with_nemo
-from lyrics_extractor import extract_lyrics_from_text, add_punctuation_with_gemini
-from generate_background import generate_background_image, get_lyrics_text_from_json
-
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+# Alignment and image generation are imported where they are used: --help
+# loads neither, and resumed runs (lyrics.json present) skip the aligner
+from lyrics_extractor import extract_lyrics_from_file, add_punctuation_with_gemini
+from batch_processor import _find_ground_truth
+from json_utils import _write_json
+
 # Path to the Remotion video project
 VIDEO_PROJECT_DIR = Path(__file__).parent / "video"
 
 
-def render_video(audio_path, lyrics_path, output_video_path):
+def _start_background_generation(song_name, lyrics_text):
+    """
+    Start background-image generation on a worker thread so its Gemini calls
+    overlap asset staging. Returns a Future.
+    """
+    from generate_background import generate_background_image
+    
+    bg_image_path = str(VIDEO_PROJECT_DIR / "public" / "background.jpg")
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(generate_background_image, song_name, lyrics_text, bg_image_path)
+    pool.shutdown(wait=False)
+    return future
+
+
+def _stage(src, dst, size=None):
+    """
+    Place src at dst for Remotion. A hard link costs no I/O; fall back to a
+    copy across filesystems or where links fail. size: src's size, if known.
+    """
+    dst = Path(dst)
+    try:
+        if os.path.samefile(src, dst):
+            return  # already linked from a previous render of this song
+    except OSError:
+        pass
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        _copy_file(src, dst, size)
+
+
+def _copy_file(src, dst, size=None):
+    """
+    Copy src to dst with in-kernel sendfile on Linux; elsewhere (or if
+    sendfile fails) copy in 1 MiB chunks instead of shutil's 64 KiB default.
+    size: src's size when the caller already stat'ed it.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if size is None:
+            size = os.fstat(fsrc.fileno()).st_size
+        if sys.platform.startswith("linux"):
+            try:
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return
+            except OSError:
+                fdst.seek(0)
+                fdst.truncate()
+        # Small files (lyrics.json) are copied in one read
+        shutil.copyfileobj(fsrc, fdst, length=max(min(size, 1024 * 1024), 1))
+
+
+@lru_cache(maxsize=1)
+def _npx():
+    """Full path to npx, resolved once (npx.cmd on Windows, where there is no shell to find it)."""
+    return shutil.which("npx.cmd" if os.name == "nt" else "npx") or "npx"
+
+
+def render_video(audio_path, lyrics_path, output_video_path, audio_size=None):
     """
     Copies assets to Remotion's public folder, renders the video,
     and saves the final MP4 to the song's output folder.
+    
+    The background prompt is always built from lyrics_path, so fresh and
+    resumed runs of a song share the same topic cache entry.
+    audio_size: size of audio_path in bytes, if the caller already stat'ed it.
     """
     print(f"\n--- Step 4: Rendering lyric video with Remotion ---")
+    from generate_background import generate_background_image, get_lyrics_text_from_json
 
+    # Resolve every path once
+    audio_path = Path(audio_path)
+    lyrics_path = os.fspath(lyrics_path)
+    song_name = audio_path.stem
     public_dir = VIDEO_PROJECT_DIR / "public"
-    public_dir.mkdir(parents=True, exist_ok=True)
+    bg_image_path = os.fspath(public_dir / "background.jpg")
+
+    # Generate background image based on song content, overlapping staging
+    lyrics_text = get_lyrics_text_from_json(lyrics_path)
+    background_job = _start_background_generation(song_name, lyrics_text)
 
-    # Copy audio and lyrics to Remotion's public folder
-    shutil.copy2(str(audio_path), str(public_dir / "audio.mp3"))
-    shutil.copy2(str(lyrics_path), str(public_dir / "lyrics.json"))
-    print(f"Assets copied to {public_dir}")
+    public_dir.mkdir(parents=True, exist_ok=True)
 
-    # Generate background image based on song content
-    song_name = Path(audio_path).stem
-    lyrics_text = get_lyrics_text_from_json(str(lyrics_path))
-    bg_image_path = str(public_dir / "background.jpg")
-    generate_background_image(song_name, lyrics_text, bg_image_path)
+    # Stage audio and lyrics in Remotion's public folder — concurrently, so
+    # a fallback copy of lyrics.json hides behind the (larger) MP3 copy
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        staged = [
+            pool.submit(_stage, audio_path, public_dir / "audio.mp3", audio_size),
+            pool.submit(_stage, lyrics_path, public_dir / "lyrics.json"),
+        ]
+        for job in staged:
+            job.result()
+    print(f"Assets staged in {public_dir}")
 
     # Ensure output directory exists and use absolute path
     output_video_path = Path(output_video_path).resolve()
     output_video_path.parent.mkdir(parents=True, exist_ok=True)
 
+    # Remotion bundles public/ when it starts, so the image must be in place
+    # before the CLI launches
+    try:
+        background_job.result()
+    except Exception as e:
+        print(f"Background image generation failed: {e}. Retrying inline...")
+        generate_background_image(song_name, lyrics_text, bg_image_path)
+
     # Render the video using Remotion CLI
-    render_cmd = f'npx remotion render LyricVideo "{output_video_path}" --concurrency=100% --log=error'
+    # (argument list, no shell: nothing to quote and no extra shell process)
+    render_cmd = [_npx(), "remotion", "render", "LyricVideo", os.fspath(output_video_path),
+                  "--concurrency=100%", "--log=error"]
 
     print(f"Rendering video... (this may take a few minutes)")
     try:
-        result = subprocess.run(
-            render_cmd,
-            cwd=str(VIDEO_PROJECT_DIR),
-            shell=True,
-        )
-        if result.returncode == 0:
+        proc = subprocess.Popen(render_cmd, cwd=VIDEO_PROJECT_DIR)
+        try:
+            returncode = proc.wait()
+        except BaseException:
+            proc.kill()  # don't leave a headless Chrome render running
+            raise
+        if returncode == 0:
             print(f"--- SUCCESS: Video saved to {output_video_path} ---")
             return True
         else:
-            print(f"Remotion render failed with exit code {result.returncode}")
+            print(f"Remotion render failed with exit code {returncode}")
             return False
     except Exception as e:
         print(f"Error running Remotion render: {e}")
@@ -69,8 +159,13 @@ def main(audio_path, ground_truth_text=None, **kwargs):
       2. NeMo forced alignment (precise timestamps)
       3. Render video (Remotion)
     """
+    from dotenv import load_dotenv
+    load_dotenv()
+    
     audio_file = Path(audio_path)
-    if not audio_file.exists():
+    try:
+        audio_size = os.stat(audio_file).st_size  # single stat, reused for staging
+    except FileNotFoundError:
         print(f"Error: Audio file not found at {audio_path}")
         return
 
@@ -94,10 +189,9 @@ def main(audio_path, ground_truth_text=None, **kwargs):
             print(f"  Using provided ground truth lyrics ({len(lyrics_text.splitlines())} lines)")
         else:
             # Try to find matching txt file
-            txt_path = _find_ground_truth_file(audio_file)
+            txt_path = _find_ground_truth(audio_file)
             if txt_path:
-                raw_text = open(txt_path, "r", encoding="utf-8").read()
-                lyrics_text = extract_lyrics_from_text(raw_text)
+                lyrics_text = extract_lyrics_from_file(txt_path)
                 print(f"  Extracted lyrics from: {txt_path.name}")
             else:
                 print(f"  ERROR: No lyrics found for {song_name}")
@@ -116,6 +210,7 @@ def main(audio_path, ground_truth_text=None, **kwargs):
 
         # Step 3: NeMo forced alignment (writes to temp file, then renames)
         print(f"\n--- Step 3: NeMo Forced Alignment ---")
+        from nemo_align import align_with_nemo
         lyrics_tmp = lyrics_file.with_suffix(".tmp")
         result = align_with_nemo(
             str(audio_file),
@@ -133,11 +228,13 @@ def main(audio_path, ground_truth_text=None, **kwargs):
             print("  Falling back to Gemini alignment...")
             try:
                 from gemini_align import full_pipeline_gemini
-                result = full_pipeline_gemini(str(audio_path), lyrics_text)
+                from gemini_cache import cache_key, cached_call, file_digest
+                # Same audio + lyrics → reuse the previous Gemini alignment
+                align_key = cache_key("full_pipeline_gemini", file_digest(audio_file), lyrics_text)
+                result = cached_call("align", align_key, full_pipeline_gemini, str(audio_path), lyrics_text)
                 if result:
                     lyrics_tmp = lyrics_file.with_suffix(".tmp")
-                    with open(lyrics_tmp, 'w', encoding='utf-8') as f:
-                        json.dump(result, f, ensure_ascii=False, indent=2)
+                    _write_json(lyrics_tmp, result)
                     lyrics_tmp.rename(lyrics_file)
                     print(f"  Gemini fallback: {len(result)} segments saved")
                 else:
@@ -152,7 +249,7 @@ def main(audio_path, ground_truth_text=None, **kwargs):
     # Step 3: Render Video
     print(f"\n--- Step 4: Rendering Final Video ---")
     video_output = song_output_dir / f"{song_name}.mp4"
-    render_video(audio_file, lyrics_file, video_output)
+    render_video(audio_file, lyrics_file, video_output, audio_size=audio_size)
 
     print(f"\n{'='*60}")
     print(f"  ALL DONE! Your files are in: {song_output_dir}")
@@ -161,32 +258,6 @@ def main(audio_path, ground_truth_text=None, **kwargs):
     print(f"{'='*60}")
 
 
-def _find_ground_truth_file(audio_path):
-    """Find matching ground truth lyrics file."""
-    audio_path = Path(audio_path)
-    gt_dir = Path("ground_truth_lyrics")
-    
-    if not gt_dir.exists():
-        return None
-    
-    # Try: ground_truth_lyrics/<audio_name>.mp3.txt
-    candidates = [
-        gt_dir / f"{audio_path.name}.txt",
-        gt_dir / f"{audio_path.stem}.txt",
-    ]
-    
-    for c in candidates:
-        if c.exists():
-            return c
-    
-    # Fuzzy match
-    for f in gt_dir.glob("*.txt"):
-        if audio_path.stem[:20] in f.name:
-            return f
-    
-    return None
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="LyricFlow — Audio to Lyric Video Pipeline")
     parser.add_argument("audio", help="Path to MP3 file")
@@ -196,7 +267,6 @@ if __name__ == "__main__":
     
     ground_truth_text = None
     if args.lyrics:
-        raw = open(args.lyrics, "r", encoding="utf-8").read()
-        ground_truth_text = extract_lyrics_from_text(raw)
+        ground_truth_text = extract_lyrics_from_file(args.lyrics)
     
     main(args.audio, ground_truth_text=ground_truth_text)
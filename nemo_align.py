@@ -5,7 +5,7 @@ Uses NVIDIA NeMo's CTC-based ASR model to produce precise word-level
 timestamps for Hindi lyrics via forced alignment.
 
 How it works:
-1. Converts audio to 16kHz mono WAV
+1. Decodes audio with ffmpeg, piping 16kHz mono PCM straight into numpy
 2. Gets character-level log-probabilities from NeMo's Hindi CTC model
 3. Tokenizes the ground-truth lyrics into the model's character set
 4. Runs CTC forced alignment (Viterbi) to find optimal character-to-frame mapping
@@ -18,49 +18,205 @@ Usage:
 
 import os
 import sys
-import json
 import re
-import tempfile
 import subprocess
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+from json_utils import _write_json
 
-def _convert_to_wav(audio_path, output_wav=None):
-    """Convert any audio to 16kHz mono WAV for NeMo."""
+try:
+    import numba  # optional: compiled CTC forward pass
+except ImportError:
+    numba = None
+
+
+def _decode_audio(audio_path, sr=16000):
+    """
+    Decode any audio to 16kHz mono float32 samples for NeMo. ffmpeg streams
+    raw PCM to stdout, so no temporary WAV is written and re-parsed.
+    """
     audio_path = Path(audio_path)
-    if output_wav is None:
-        output_wav = audio_path.with_suffix(".wav")
-    output_wav = Path(output_wav)
     
-    print(f"  Converting {audio_path.name} → 16kHz mono WAV...", flush=True)
+    print(f"  Decoding {audio_path.name} → {sr // 1000}kHz mono PCM...", flush=True)
     cmd = [
-        "ffmpeg", "-y", "-i", str(audio_path),
-        "-ar", "16000", "-ac", "1", "-f", "wav",
-        str(output_wav)
+        "ffmpeg", "-loglevel", "error", "-i", str(audio_path),
+        "-ar", str(sr), "-ac", "1", "-f", "s16le", "-"
     ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    result = subprocess.run(cmd, capture_output=True)
     if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg conversion failed: {result.stderr[:200]}")
+        raise RuntimeError(f"ffmpeg conversion failed: {result.stderr.decode(errors='replace')[:200]}")
     
-    return str(output_wav)
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+# Any Devanagari character (CLI fallback lyric extraction)
+_DEVA_RE = re.compile(r'[\u0900-\u097F]')
+
+# Punctuation dropped before alignment (single C-level pass via str.translate)
+_PUNCT_TABLE = str.maketrans("", "", ",!।|.?;:-()'\"")
 
 
 def _strip_punctuation(text):
     """Remove punctuation from text for alignment (model needs clean text)."""
-    text = re.sub(r'[,!।|.?;:\-()\'\"]+', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    return " ".join(text.translate(_PUNCT_TABLE).split())
+
+
+def _ctc_forward_numpy(emit, skip_ok, lo, hi):
+    """
+    CTC Viterbi forward pass, vectorized over states (one numpy step per frame).
+    Returns (alpha row at the last frame, back table (T, L) uint8); the full
+    alpha table is never materialized. emit[t, s] is the log-prob of state
+    s's token at frame t. Only states lo[t] <= s < hi[t] are evaluated at
+    frame t; everything outside that band stays at NEG_INF.
+    """
+    T, L = emit.shape
+    
+    # DP over two rolling rows: prev = alpha[t-1], cur = alpha[t]. Only the
+    # per-frame choice (back, 1 byte per cell) is kept for the backtrack.
+    NEG_INF = np.float32(-1e30)
+    prev = np.full(L, NEG_INF, dtype=np.float32)
+    cur = np.full(L, NEG_INF, dtype=np.float32)
+    back = np.empty((T, L), dtype=np.uint8)
+    back[0] = 0
+    
+    # Initialize: can start with blank or first token
+    prev[0] = emit[0, 0]
+    if L > 1:
+        prev[1] = emit[0, 1]
+    
+    # Fill DP one frame at a time, vectorized over the band's states.
+    # cand rows: stay / transition from previous state / skip; slots that
+    # have no predecessor (cand[1, 0], cand[2, :2]) are never written.
+    cand = np.full((3, L), NEG_INF, dtype=np.float32)
+    for t in range(1, T):
+        a, b = lo[t], hi[t]
+        if t > 1:
+            # cur still holds frame t-2; reset its band so cells outside
+            # this frame's band read as unreachable
+            cur[lo[t-2]:hi[t-2]] = NEG_INF
+        a1 = max(a, 1)
+        a2 = max(a, 2)
+        cand[0, a:b] = prev[a:b]
+        cand[1, a1:b] = prev[a1-1:b-1]
+        cand[2, a2:b] = np.where(skip_ok[a2:b], prev[a2-2:b-2], NEG_INF)
+        band = cand[:, a:b]
+        back[t, a:b] = band.argmax(axis=0)  # first max wins ties, same as stay > shift > skip
+        np.max(band, axis=0, out=cur[a:b])
+        cur[a:b] += emit[t, a:b]
+        prev, cur = cur, prev
+    
+    return prev, back
+
+
+def _ctc_forward_loops(emit, skip_ok, lo, hi):
+    """
+    Same forward pass as _ctc_forward_numpy written as plain loops, for
+    numba to compile (see _ctc_forward_jit). Keeps only two alpha rows.
+    """
+    T, L = emit.shape
+    NEG_INF = np.float32(-1e30)
+    prev = np.full(L, NEG_INF, dtype=np.float32)
+    cur = np.full(L, NEG_INF, dtype=np.float32)
+    back = np.zeros((T, L), dtype=np.uint8)
+    
+    prev[0] = emit[0, 0]
+    if L > 1:
+        prev[1] = emit[0, 1]
+    
+    for t in range(1, T):
+        if t > 1:
+            for s in range(lo[t-2], hi[t-2]):
+                cur[s] = NEG_INF
+        for s in range(lo[t], hi[t]):
+            # Strict > keeps the earlier candidate on ties: stay > shift > skip
+            best = prev[s]
+            choice = 0
+            if s > 0 and prev[s-1] > best:
+                best = prev[s-1]
+                choice = 1
+            if s > 1 and skip_ok[s] and prev[s-2] > best:
+                best = prev[s-2]
+                choice = 2
+            cur[s] = best + emit[t, s]
+            back[t, s] = choice
+        prev, cur = cur, prev
+    
+    return prev, back
+
+
+def _ctc_backtrack_loops(back, best_s):
+    """
+    Follow the back table from best_s at the last frame to frame 0.
+    Returns the state per frame as an int64 array, filled back to front.
+    """
+    T = back.shape[0]
+    path = np.empty(T, dtype=np.int64)
+    path[T-1] = best_s
+    s = best_s
+    for t in range(T-1, 0, -1):
+        s -= int(back[t, s])
+        path[t-1] = s
+    return path
+
+
+# Compiled forward pass / backtrack when numba is installed (optional speedup;
+# nogil so they don't stall other pipeline threads), else numpy / plain loops
+_ctc_forward_jit = numba.njit(cache=True, nogil=True)(_ctc_forward_loops) if numba is not None else None
+_ctc_backtrack_jit = numba.njit(cache=True, nogil=True)(_ctc_backtrack_loops) if numba is not None else None
+
+
+@lru_cache(maxsize=1)
+def _torchaudio_functional():
+    """torchaudio.functional when installed (for its C++ forced_align), else None."""
+    try:
+        import torchaudio.functional as F
+    except ImportError:
+        return None
+    return F if hasattr(F, "forced_align") else None
+
+
+def _torchaudio_forced_align(log_probs, targets, blank_id):
+    """
+    CTC forced alignment with torchaudio's native forced_align kernel.
+    Same output as _ctc_forced_align; returns None when torchaudio is not
+    available or rejects the input (the DP below is used then).
+    """
+    F = _torchaudio_functional()
+    if F is None:
+        return None
+    import torch
+    
+    try:
+        emissions = torch.from_numpy(np.ascontiguousarray(log_probs, dtype=np.float32)).unsqueeze(0)
+        tokens = torch.tensor([list(targets)], dtype=torch.int32)
+        aligned, scores = F.forced_align(emissions, tokens, blank=blank_id)
+        spans = F.merge_tokens(aligned[0], scores[0].exp(), blank=blank_id)
+    except Exception as e:
+        print(f"  torchaudio forced_align failed ({e}), using built-in aligner", flush=True)
+        return None
+    # One span per target token, in order; anything else and the DP decides
+    if [span.token for span in spans] != list(targets):
+        return None
+    # TokenSpan.end is exclusive
+    return [(i, span.start, span.end - 1) for i, span in enumerate(spans)]
 
 
-def _ctc_forced_align(log_probs, targets, blank_id=0):
+def _ctc_forced_align(log_probs, targets, blank_id=0, band_width=None):
     """
-    CTC forced alignment using dynamic programming.
+    CTC forced alignment using dynamic programming. Uses torchaudio's
+    forced_align when it is installed (and no band is requested).
     
     Args:
         log_probs: numpy array (T, C) - log probabilities per frame
         targets: list of int - target token indices
         blank_id: blank token index (usually 0)
+        band_width: if set, only evaluate states within +/- band_width of the
+            diagonal s = t * L / T (approximate; assumes lyrics are sung at a
+            roughly even pace). Falls back to the full DP when the best path
+            runs into the band edge.
     
     Returns:
         List of (token_idx, start_frame, end_frame) tuples
@@ -71,6 +227,12 @@ def _ctc_forced_align(log_probs, targets, blank_id=0):
     if S == 0:
         return []
     
+    # Exact alignment: prefer torchaudio's compiled kernel when installed
+    if band_width is None:
+        alignments = _torchaudio_forced_align(log_probs, targets, blank_id)
+        if alignments is not None:
+            return alignments
+    
     # Build target sequence with blanks: [blank, t0, blank, t1, blank, ...]
     # This allows optional blanks between tokens
     expanded = [blank_id]
@@ -79,58 +241,63 @@ def _ctc_forced_align(log_probs, targets, blank_id=0):
         expanded.append(blank_id)
     L = len(expanded)
     
-    # DP: alpha[t][s] = log-prob of best alignment up to frame t, state s
-    NEG_INF = -1e30
-    alpha = np.full((T, L), NEG_INF)
+    expanded = np.array(expanded, dtype=np.int64)
+    
+    # Skip blank transition (s-2) only if current and s-2 are different non-blank
+    skip_ok = np.zeros(L, dtype=bool)
+    skip_ok[2:] = expanded[2:] != expanded[:-2]
+    
+    # Gather each state's emission column once: (T, L), contiguous over states,
+    # so the DP reads sequential memory instead of indexing the vocab axis.
+    # float32 throughout: CTC log-probs are small and path sums over a few
+    # thousand frames are well within its range, at half the memory traffic.
+    emit = np.ascontiguousarray(log_probs[:, expanded], dtype=np.float32)
+    
+    # Per-frame state window [lo[t], hi[t]): the whole table, or a diagonal
+    # band (Sakoe-Chiba) around s = t * L / T
+    banded = band_width is not None and 2 * band_width + 1 < L
+    if banded:
+        center = np.arange(T, dtype=np.int64) * L // T
+        lo = np.clip(center - band_width, 0, L)
+        hi = np.clip(center + band_width + 1, 0, L)
+    else:
+        lo = np.zeros(T, dtype=np.int64)
+        hi = np.full(T, L, dtype=np.int64)
     
-    # Initialize: can start with blank or first token
-    alpha[0][0] = log_probs[0][expanded[0]]
-    if L > 1:
-        alpha[0][1] = log_probs[0][expanded[1]]
+    # Forward pass: final alpha row + back[t][s] = which predecessor won at
+    # frame t (0 = stay, 1 = s-1, 2 = s-2)
+    if _ctc_forward_jit is not None:
+        last, back = _ctc_forward_jit(emit, skip_ok, lo, hi)
+    else:
+        last, back = _ctc_forward_numpy(emit, skip_ok, lo, hi)
     
-    # Fill DP table
-    for t in range(1, T):
-        for s in range(L):
-            # Stay in same state
-            score = alpha[t-1][s]
-            
-            # Transition from previous state
-            if s > 0:
-                score = max(score, alpha[t-1][s-1])
-            
-            # Skip blank transition (s-2) if current and s-2 are different non-blank
-            if s > 1 and expanded[s] != expanded[s-2]:
-                score = max(score, alpha[t-1][s-2])
-            
-            alpha[t][s] = score + log_probs[t][expanded[s]]
+    if banded and max(last[L-1], last[L-2]) < -1e29:
+        print("  Band too narrow to reach the end state, re-running full alignment...", flush=True)
+        return _ctc_forced_align(log_probs, targets, blank_id)
     
     # Backtrack to find best path
     # End at last or second-to-last state
-    if alpha[T-1][L-1] >= alpha[T-1][L-2]:
+    if last[L-1] >= last[L-2]:
         best_s = L - 1
     else:
         best_s = L - 2
     
-    # Backtrack
-    path = [best_s]
-    for t in range(T-2, -1, -1):
-        s = path[-1]
-        candidates = [(alpha[t][s], s)]
-        if s > 0:
-            candidates.append((alpha[t][s-1], s-1))
-        if s > 1 and expanded[s] != expanded[s-2]:
-            candidates.append((alpha[t][s-2], s-2))
-        best = max(candidates, key=lambda x: x[0])
-        path.append(best[1])
+    # Backtrack by following the stored predecessor choices
+    backtrack = _ctc_backtrack_jit if _ctc_backtrack_jit is not None else _ctc_backtrack_loops
+    path = backtrack(back, best_s)
     
-    path.reverse()
+    if banded:
+        # A path that touches the band edge may have been cut off by it
+        if (((path == lo) & (lo > 0)) | ((path == hi - 1) & (hi < L))).any():
+            print("  Alignment path hit the band edge, re-running full alignment...", flush=True)
+            return _ctc_forced_align(log_probs, targets, blank_id)
     
     # Extract token alignments (skip blanks)
     alignments = []
     current_token_state = None
     start_frame = 0
     
-    for t, s in enumerate(path):
+    for t, s in enumerate(path.tolist()):
         if s % 2 == 1:  # Non-blank state
             token_idx = s // 2  # Index into original targets
             if current_token_state != s:
@@ -154,6 +321,293 @@ def _ctc_forced_align(log_probs, targets, blank_id=0):
     return alignments
 
 
+NEMO_MODEL_NAME = "stt_hi_conformer_ctc_medium"
+
+# Encoder windowing for long songs (seconds); keeps conformer memory bounded
+_ENCODER_WINDOW_S = 30.0
+_ENCODER_OVERLAP_S = 1.0
+_ENCODER_BATCH = 4
+
+
+def _greedy_anchored_align(log_probs, targets, blank_id=0, min_match=0.9, min_anchor=3):
+    """
+    Fast path for forced alignment when the model already hears the lyrics.
+    
+    Greedy-decodes the CTC output, matches it against the targets with
+    difflib, and takes runs of at least min_anchor matching tokens as fixed
+    anchors (their greedy frames). Only the unmatched stretches between
+    anchors go through _ctc_forced_align, on their own frame slices.
+    Returns the same (token_idx, start_frame, end_frame) list, or None when
+    fewer than min_match of the targets are anchored (use full Viterbi then).
+    """
+    from difflib import SequenceMatcher
+    
+    T = log_probs.shape[0]
+    S = len(targets)
+    
+    # Greedy decode, collapsed to runs of one non-blank symbol
+    preds = log_probs.argmax(axis=1)
+    change = np.flatnonzero(preds[1:] != preds[:-1]) + 1
+    run_starts = np.concatenate(([0], change))
+    run_ends = np.concatenate((change, [T])) - 1
+    keep = preds[run_starts] != blank_id
+    run_starts, run_ends = run_starts[keep], run_ends[keep]
+    greedy = preds[run_starts].tolist()
+    
+    matcher = SequenceMatcher(None, greedy, list(targets), autojunk=False)
+    blocks = [b for b in matcher.get_matching_blocks() if b.size >= min_anchor]
+    if sum(b.size for b in blocks) < min_match * S:
+        return None
+    
+    alignments = []
+    
+    def fill_gap(j0, j1, t0, t1):
+        # Viterbi over just this stretch; False if it can't fit the tokens
+        if j1 <= j0:
+            return True
+        sub = targets[j0:j1]
+        repeats = sum(1 for a, b in zip(sub, sub[1:]) if a == b)
+        if t1 - t0 < len(sub) + repeats:
+            return False
+        alignments.extend((k + j0, start + t0, end + t0)
+                          for k, start, end in _ctc_forced_align(log_probs[t0:t1], sub, blank_id))
+        return True
+    
+    prev_t, prev_j = 0, 0
+    for i, j, size in blocks:
+        if not fill_gap(prev_j, j, prev_t, int(run_starts[i])):
+            return None
+        alignments.extend((j + k, int(run_starts[i + k]), int(run_ends[i + k])) for k in range(size))
+        prev_t, prev_j = int(run_ends[i + size - 1]) + 1, j + size
+    if not fill_gap(prev_j, S, prev_t, T):
+        return None
+    
+    return alignments
+
+
+def _plan_parallel_chunks(log_probs, blank_id, line_token_starts, n_tokens, n_chunks, min_gap_frames):
+    """
+    Split the song into up to n_chunks independent (frames, tokens) pieces at
+    long pauses, for aligning the pieces in parallel.
+    
+    A greedy CTC decode marks pauses (blank runs of at least min_gap_frames)
+    and counts emitted tokens. Each pause is mapped to the lyric line whose
+    start is nearest to the share of tokens already emitted there. Returns
+    [(t0, t1, k0, k1), ...], or None if no plausible split exists.
+    """
+    T = log_probs.shape[0]
+    greedy = log_probs.argmax(axis=1)
+    is_blank = greedy == blank_id
+    
+    # Token emission events: a non-blank frame that starts a new symbol
+    emits = ~is_blank
+    emits[1:] &= (greedy[1:] != greedy[:-1])
+    events = np.cumsum(emits)
+    total_events = int(events[-1])
+    if total_events == 0:
+        return None
+    
+    # Blank runs (pauses); interior runs only
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], is_blank.view(np.int8), [0]))))
+    run_starts, run_ends = edges[0::2], edges[1::2]
+    keep = (run_ends - run_starts >= min_gap_frames) & (run_starts > 0) & (run_ends < T)
+    split_frames = (run_starts[keep] + run_ends[keep]) // 2
+    if len(split_frames) == 0:
+        return None
+    
+    line_starts = np.asarray(line_token_starts[1:])
+    frames, tokens = [0], [0]
+    for j in range(1, n_chunks):
+        # Pause whose emitted-token share is closest to j / n_chunks
+        f = int(split_frames[np.abs(events[split_frames] - total_events * j / n_chunks).argmin()])
+        # Snap the estimated token position to the nearest line start
+        k_est = events[f] / total_events * n_tokens
+        k = int(line_starts[np.abs(line_starts - k_est).argmin()])
+        if f > frames[-1] and k > tokens[-1]:
+            frames.append(f)
+            tokens.append(k)
+    frames.append(T)
+    tokens.append(n_tokens)
+    
+    chunks = [(frames[i], frames[i+1], tokens[i], tokens[i+1]) for i in range(len(frames) - 1)]
+    # Each piece needs at least one frame per token to be alignable
+    if len(chunks) < 2 or any(t1 - t0 <= k1 - k0 for t0, t1, k0, k1 in chunks):
+        return None
+    return chunks
+
+
+def _align_parallel(log_probs, full_tokens, blank_id, chunks, band_width=None):
+    """
+    Align each (t0, t1, k0, k1) chunk independently on a thread pool and
+    stitch the results back into whole-song token / frame indices.
+    """
+    def align_chunk(chunk):
+        t0, t1, k0, k1 = chunk
+        result = _ctc_forced_align(log_probs[t0:t1], full_tokens[k0:k1], blank_id, band_width=band_width)
+        return [(k + k0, start + t0, end + t0) for k, start, end in result]
+    
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        parts = list(pool.map(align_chunk, chunks))
+    return [a for part in parts for a in part]
+
+
+@lru_cache(maxsize=2)
+def _load_model(model_name, device):
+    """Load a NeMo ASR model once per process (batch runs align many songs)."""
+    import torch
+    from nemo.collections.asr.models import ASRModel
+    
+    if device == "cpu" and "OMP_NUM_THREADS" not in os.environ:
+        # Use the cores for the encoder's intra-op parallelism (one left for
+        # ffmpeg / the rest of the pipeline) unless the user pinned a count
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) - 1))
+        try:
+            torch.set_num_interop_threads(2)
+        except RuntimeError:
+            pass  # can only be set before torch starts inter-op work
+    
+    print(f"  Loading model: {model_name} ({device})...", flush=True)
+    model = ASRModel.from_pretrained(model_name, map_location=device)
+    return model.to(device).eval()
+
+
+def _compute_log_probs(audio_path, model_name):
+    """
+    Run the NeMo CTC model over the audio.
+    Returns (log_probs (T, C) float32, audio_duration seconds, vocabulary list).
+    """
+    import torch
+    
+    sr = 16000
+    
+    # Step 1: Decode audio — ffmpeg runs in its own process, so decode on a
+    # worker thread while the model loads
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        audio_job = pool.submit(_decode_audio, audio_path, sr)
+        
+        # Step 2: Load Hindi CTC model (on the GPU when there is one)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model = _load_model(model_name, device)
+        
+        audio_data = audio_job.result()
+    
+    # Step 3: Get log-probabilities from model
+    print("  Computing log-probabilities...", flush=True)
+    
+    audio_duration = len(audio_data) / sr
+    print(f"  Audio duration: {audio_duration:.1f}s", flush=True)
+    
+    # Get log-probs using model's preprocessor + encoder, in overlapping
+    # windows so peak memory stays bounded on long songs
+    log_probs = _encode_windows(model, audio_data, sr, device)
+    
+    return log_probs, audio_duration, list(model.decoder.vocabulary)
+
+
+def _forward_batch(model, windows, device):
+    """
+    One model.forward over a list of 1-D float arrays (zero-padded to the
+    longest). Returns a list of per-window (frames, C) float32 log-prob arrays.
+    """
+    import torch
+    
+    lengths = [len(w) for w in windows]
+    batch = np.zeros((len(windows), max(lengths)), dtype=np.float32)
+    for i, w in enumerate(windows):
+        batch[i, :len(w)] = w
+    audio_tensor = torch.from_numpy(batch).to(device)
+    audio_len = torch.tensor(lengths, dtype=torch.int64).to(device)
+    
+    # fp16 autocast on GPU; inference_mode skips autograd bookkeeping entirely
+    with torch.inference_mode(), torch.autocast(device_type=device, dtype=torch.float16,
+                                                enabled=(device == "cuda")):
+        # NeMo 2.7.0 EncDecCTCModelBPE.forward returns (log_probs, log_probs_len, greedy_preds)
+        outputs = model.forward(
+            input_signal=audio_tensor, input_signal_length=audio_len
+        )
+    if isinstance(outputs, tuple):
+        log_probs, log_probs_len = outputs[0], outputs[1].tolist()
+    else:
+        log_probs, log_probs_len = outputs, [outputs.shape[1]] * len(windows)
+    
+    log_probs = log_probs.float().cpu().numpy()
+    return [log_probs[i, :n] for i, n in enumerate(log_probs_len)]
+
+
+def _encode_windows(model, audio_data, sr, device):
+    """
+    Run the model over audio_data in _ENCODER_WINDOW_S windows overlapping by
+    _ENCODER_OVERLAP_S, _ENCODER_BATCH windows per forward call, and stitch
+    the log-probs back into one (T, C) array. Each seam keeps the frames
+    nearest the center of their window (half the overlap from each side).
+    """
+    audio_data = np.asarray(audio_data, dtype=np.float32)
+    window = int(_ENCODER_WINDOW_S * sr)
+    overlap = int(_ENCODER_OVERLAP_S * sr)
+    if len(audio_data) <= window:
+        return _forward_batch(model, [audio_data], device)[0]
+    
+    step = window - overlap
+    starts = list(range(0, len(audio_data) - overlap, step))
+    pieces = []
+    for i in range(0, len(starts), _ENCODER_BATCH):
+        batch_starts = starts[i:i + _ENCODER_BATCH]
+        pieces += _forward_batch(model, [audio_data[s:s + window] for s in batch_starts], device)
+    
+    # Samples per output frame: preprocessor hop x encoder subsampling (640 at
+    # 16kHz). A window of n samples yields n // hop + 1 frames, so when the
+    # config is unavailable the stride is window / (frames - 1), not / frames.
+    try:
+        hop = int(round(model.cfg.preprocessor.window_stride * sr * model.cfg.encoder.subsampling_factor))
+    except (AttributeError, KeyError, TypeError):
+        hop = window / (len(pieces[0]) - 1)
+    half = int(round(overlap / 2 / hop))
+    stitched = []
+    n_frames = 0
+    for i, (start, lp) in enumerate(zip(starts, pieces)):
+        # Continue where the previous window stopped on the global frame grid.
+        # With the default 29s step every window starts on a whole frame
+        # (725 x 640 samples), so seams neither drop nor repeat frames.
+        lo = max(n_frames - int(round(start / hop)), 0)
+        hi = len(lp) - half if i < len(pieces) - 1 else len(lp)
+        stitched.append(lp[lo:hi])
+        n_frames += max(hi - lo, 0)
+    return np.concatenate(stitched)
+
+
+def _get_log_probs(audio_path, model_name):
+    """
+    _compute_log_probs, memoized on disk by model + audio content, so
+    re-aligning the same song (e.g. after editing its lyrics) skips the
+    ffmpeg decode, the model load and the encoder pass.
+    """
+    from gemini_cache import CACHE_ROOT, cache_key, file_digest
+    
+    cache_path = CACHE_ROOT / "nemo_logprobs" / f"{cache_key(model_name, file_digest(audio_path))}.npz"
+    try:
+        with np.load(cache_path) as cached:
+            log_probs = cached["log_probs"]
+            audio_duration = float(cached["duration"])
+            vocab = cached["vocab"].tolist()
+        print(f"  Using cached log-probabilities ({log_probs.shape[0]} frames)", flush=True)
+        return log_probs, audio_duration, vocab
+    except (OSError, KeyError, ValueError):
+        pass
+    
+    log_probs, audio_duration, vocab = _compute_log_probs(audio_path, model_name)
+    
+    tmp = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "wb") as f:
+            np.savez(f, log_probs=log_probs, duration=audio_duration, vocab=np.array(vocab))
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        print(f"  WARNING: Could not cache log-probabilities: {e}", flush=True)
+    
+    return log_probs, audio_duration, vocab
+
+
 def align_with_nemo(audio_path, lyrics_text, output_path=None):
     """
     Main function: Align lyrics to audio using NeMo's Hindi CTC model.
@@ -166,9 +620,6 @@ def align_with_nemo(audio_path, lyrics_text, output_path=None):
     Returns:
         List of segments: [{"text": str, "start": float, "end": float, "words": [...]}]
     """
-    import torch
-    from nemo.collections.asr.models import ASRModel
-    
     audio_path = Path(audio_path)
     original_lines = [l.strip() for l in lyrics_text.strip().split("\n") if l.strip()]
     
@@ -178,189 +629,166 @@ def align_with_nemo(audio_path, lyrics_text, output_path=None):
     
     print(f"  NeMo Forced Aligner: {len(original_lines)} lyrics lines", flush=True)
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
-        
-        # Step 1: Convert to WAV
-        wav_path = _convert_to_wav(audio_path, tmpdir / "audio.wav")
-        
-        # Step 2: Load Hindi CTC model
-        model_name = "stt_hi_conformer_ctc_medium"
-        print(f"  Loading model: {model_name}...", flush=True)
-        model = ASRModel.from_pretrained(model_name, map_location="cpu")
-        model.eval()
-        
-        # Step 3: Get log-probabilities from model
-        print("  Computing log-probabilities...", flush=True)
-        
-        # Prepare audio
-        import soundfile as sf
-        audio_data, sr = sf.read(wav_path)
-        audio_duration = len(audio_data) / sr
-        print(f"  Audio duration: {audio_duration:.1f}s", flush=True)
-        
-        # Get log-probs using model's preprocessor + encoder
-        audio_tensor = torch.tensor(audio_data, dtype=torch.float32).unsqueeze(0)
-        audio_len = torch.tensor([len(audio_data)], dtype=torch.int64)
-        
-        with torch.no_grad():
-            # NeMo 2.7.0 EncDecCTCModelBPE.forward returns (log_probs, log_probs_len, greedy_preds)
-            outputs = model.forward(
-                input_signal=audio_tensor, input_signal_length=audio_len
-            )
-            if isinstance(outputs, tuple):
-                log_probs = outputs[0]
-                log_probs_len = outputs[1]
-            else:
-                log_probs = outputs
-                log_probs_len = torch.tensor([outputs.shape[1]])
-        
-        log_probs_np = log_probs[0].cpu().numpy()  # (T, C)
-        T = log_probs_np.shape[0]
-        
-        # Time resolution: audio_duration / T
-        frame_duration = audio_duration / T
-        print(f"  {T} frames, {frame_duration*1000:.1f}ms per frame", flush=True)
-        
-        # Step 4: Get model's vocabulary (character set)
-        vocab = model.decoder.vocabulary
-        # Build char-to-index map (NeMo uses blank=len(vocab) for CTC)
-        char_to_idx = {c: i for i, c in enumerate(vocab)}
-        blank_id = len(vocab)  # CTC blank is the last index
-        
-        print(f"  Vocabulary size: {len(vocab)} + blank", flush=True)
-        
-        # Step 5: Prepare full text for alignment
-        # Join all lines, strip punctuation
-        clean_lines = [_strip_punctuation(line) for line in original_lines]
-        
-        # Process line by line for better accuracy
-        all_segments = []
-        
-        # First, do a rough pass to find where each line falls
-        # by aligning the full text at once
-        full_clean_text = " ".join(clean_lines)
-        
-        # Tokenize the full text
-        full_tokens = []
-        full_char_list = []
-        for ch in full_clean_text:
-            if ch == " ":
-                full_tokens.append(char_to_idx.get(" ", char_to_idx.get("▁", -1)))
-                full_char_list.append(" ")
-            elif ch in char_to_idx:
-                full_tokens.append(char_to_idx[ch])
-                full_char_list.append(ch)
-            # Skip chars not in vocabulary
-        
-        # Filter out -1 (unknown chars)
-        valid = [(t, c) for t, c in zip(full_tokens, full_char_list) if t >= 0]
-        full_tokens = [v[0] for v in valid]
-        full_char_list = [v[1] for v in valid]
-        
-        if not full_tokens:
-            print("  ERROR: No valid tokens found for alignment.", flush=True)
-            return None
-        
-        print(f"  Aligning {len(full_tokens)} tokens to {T} frames...", flush=True)
-        
-        # Step 6: Run CTC forced alignment
-        alignments = _ctc_forced_align(log_probs_np, full_tokens, blank_id)
-        
-        if not alignments:
-            print("  ERROR: Forced alignment returned no results.", flush=True)
-            return None
-        
-        print(f"  Alignment done: {len(alignments)} token alignments", flush=True)
-        
-        # Step 7: Convert character alignments to word + line timestamps
-        # Build character-level timestamps
-        char_times = []
-        for token_idx, start_frame, end_frame in alignments:
-            char = full_char_list[token_idx]
-            start_time = round(start_frame * frame_duration, 3)
-            end_time = round((end_frame + 1) * frame_duration, 3)
-            char_times.append({"char": char, "start": start_time, "end": end_time})
-        
-        # Group characters into words (split on spaces)
-        all_words = []
-        current_word_chars = []
-        word_start = None
-        word_end = None
-        
-        for ct in char_times:
-            if ct["char"] == " ":
-                if current_word_chars:
-                    word_text = "".join(current_word_chars)
-                    all_words.append({"word": word_text, "start": word_start, "end": word_end})
-                    current_word_chars = []
-                    word_start = None
-            else:
-                current_word_chars.append(ct["char"])
-                if word_start is None:
-                    word_start = ct["start"]
-                word_end = ct["end"]
-        
-        # Don't forget last word
-        if current_word_chars:
-            word_text = "".join(current_word_chars)
-            all_words.append({"word": word_text, "start": word_start, "end": word_end})
-        
-        print(f"  {len(all_words)} words extracted from alignment", flush=True)
-        
-        # Step 8: Map words back to original lines
-        segments = _map_words_to_lines(all_words, original_lines, clean_lines)
-        
-        # Clean double punctuation
-        for seg in segments:
-            seg["text"] = seg["text"].replace("!,", "!").replace(",!", "!").replace(",।", "।")
-            for w in seg.get("words", []):
-                w["word"] = w["word"].replace("!,", "!").replace(",!", "!").replace(",।", "।")
-        
-        print(f"\n  SUCCESS: {len(segments)} aligned segments", flush=True)
-        for seg in segments[:3]:
-            print(f"    [{seg['start']:.2f}-{seg['end']:.2f}s] {seg['text'][:45]}")
-            for w in seg.get("words", [])[:4]:
-                print(f"      {w['start']:.2f}-{w['end']:.2f}: \"{w['word']}\"")
-        
-        # Save if output path specified
-        if output_path:
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(segments, f, ensure_ascii=False, indent=2)
-            print(f"  Saved: {output_path}", flush=True)
-        
-        return segments
+    # Steps 1-3: WAV conversion + model log-probabilities (memoized per audio)
+    log_probs_np, audio_duration, vocab = _get_log_probs(audio_path, NEMO_MODEL_NAME)
+    T = log_probs_np.shape[0]
+    
+    # Time resolution: audio_duration / T
+    frame_duration = audio_duration / T
+    print(f"  {T} frames, {frame_duration*1000:.1f}ms per frame", flush=True)
+    
+    # Step 4: Get model's vocabulary (character set)
+    # Build char-to-index map (NeMo uses blank=len(vocab) for CTC)
+    char_to_idx = {c: i for i, c in enumerate(vocab)}
+    blank_id = len(vocab)  # CTC blank is the last index
+    
+    print(f"  Vocabulary size: {len(vocab)} + blank", flush=True)
+    
+    # Step 5: Prepare full text for alignment
+    # Join all lines, strip punctuation
+    clean_lines = [_strip_punctuation(line) for line in original_lines]
+    
+    # Process line by line for better accuracy
+    all_segments = []
+    
+    # First, do a rough pass to find where each line falls
+    # by aligning the full text at once
+    full_clean_text = " ".join(clean_lines)
+    
+    # Tokenize the full text with a codepoint -> token-id lookup table
+    # (one vectorized gather instead of a per-character dict lookup).
+    # Space maps to the model's space / word-boundary token; chars not in
+    # the vocabulary map to -1 and are dropped.
+    single_chars = [(ord(c), i) for c, i in char_to_idx.items() if len(c) == 1]
+    max_cp = max([cp for cp, _ in single_chars] + [ord(" ")]) + 1
+    lut = np.full(max_cp, -1, dtype=np.int64)
+    for cp, i in single_chars:
+        lut[cp] = i
+    lut[ord(" ")] = char_to_idx.get(" ", char_to_idx.get("▁", -1))
+    
+    cps = np.frombuffer(full_clean_text.encode("utf-32-le"), dtype=np.uint32)
+    toks = np.where(cps < max_cp, lut[np.minimum(cps, max_cp - 1)], -1)
+    mask = toks >= 0
+    full_tokens = toks[mask].tolist()
+    full_char_list = list(map(chr, cps[mask].tolist()))
+    
+    # Token index where each lyric line begins, counting the space that joins
+    # it to the previous line (the pause before a line belongs to that line)
+    line_char_starts = np.maximum(np.cumsum([0] + [len(line) + 1 for line in clean_lines[:-1]]) - 1, 0)
+    line_token_starts = np.concatenate(([0], np.cumsum(mask)))[line_char_starts]
+    
+    if not full_tokens:
+        print("  ERROR: No valid tokens found for alignment.", flush=True)
+        return None
+    
+    print(f"  Aligning {len(full_tokens)} tokens to {T} frames...", flush=True)
+    
+    # Step 6: Run CTC forced alignment
+    # Optional diagonal band (NEMO_ALIGN_BAND=<states>) for very long lyrics
+    band_width = int(os.environ.get("NEMO_ALIGN_BAND", "0")) or None
+    # Optional greedy-anchored fast path (NEMO_ALIGN_GREEDY=1): exact
+    # Viterbi only between stretches the model already transcribes correctly
+    alignments = None
+    if os.environ.get("NEMO_ALIGN_GREEDY") == "1":
+        alignments = _greedy_anchored_align(log_probs_np, full_tokens, blank_id)
+        if alignments is None:
+            print("  Greedy decode too far from the lyrics, running full alignment", flush=True)
+        else:
+            print("  Aligned from greedy-decode anchors", flush=True)
+    # Optional parallel alignment of pause-separated pieces (NEMO_ALIGN_CHUNKS=<n>)
+    n_chunks = int(os.environ.get("NEMO_ALIGN_CHUNKS", "0"))
+    chunks = None
+    if alignments is None and n_chunks > 1 and len(clean_lines) > 1:
+        chunks = _plan_parallel_chunks(log_probs_np, blank_id, line_token_starts, len(full_tokens),
+                                       n_chunks, min_gap_frames=max(1, int(0.5 / frame_duration)))
+        if chunks is None:
+            print("  No usable pauses for parallel alignment, aligning the whole song", flush=True)
+    if chunks:
+        print(f"  Aligning {len(chunks)} pieces in parallel...", flush=True)
+        alignments = _align_parallel(log_probs_np, full_tokens, blank_id, chunks, band_width=band_width)
+    elif alignments is None:
+        alignments = _ctc_forced_align(log_probs_np, full_tokens, blank_id, band_width=band_width)
+    
+    if not alignments:
+        print("  ERROR: Forced alignment returned no results.", flush=True)
+        return None
+    
+    print(f"  Alignment done: {len(alignments)} token alignments", flush=True)
+    
+    # Step 7: Convert character alignments to word + line timestamps
+    # Alignment as parallel arrays (token index / start frame / end frame)
+    tok_idx, start_frames, end_frames = np.array(alignments, dtype=np.int64).T
+    chars = np.array(full_char_list)[tok_idx]
+    
+    # Group characters into words: maximal runs of non-space characters
+    nonspace = np.flatnonzero(chars != " ")
+    breaks = np.flatnonzero(np.diff(nonspace) > 1) + 1
+    word_first = nonspace[np.concatenate(([0], breaks))] if len(nonspace) else nonspace
+    word_last = nonspace[np.concatenate((breaks - 1, [len(nonspace) - 1]))] if len(nonspace) else nonspace
+    
+    char_list = chars.tolist()
+    all_words = [
+        {"word": "".join(char_list[lo:hi + 1]),
+         "start": round(start_frame * frame_duration, 3),
+         "end": round((end_frame + 1) * frame_duration, 3)}
+        for lo, hi, start_frame, end_frame in zip(word_first.tolist(), word_last.tolist(),
+                                                  start_frames[word_first].tolist(),
+                                                  end_frames[word_last].tolist())
+    ]
+    
+    print(f"  {len(all_words)} words extracted from alignment", flush=True)
+    
+    # Step 8: Map words back to original lines
+    segments = _map_words_to_lines(all_words, original_lines, clean_lines)
+    
+    # Clean double punctuation
+    for seg in segments:
+        seg["text"] = seg["text"].replace("!,", "!").replace(",!", "!").replace(",।", "।")
+        for w in seg.get("words", []):
+            w["word"] = w["word"].replace("!,", "!").replace(",!", "!").replace(",।", "।")
+    
+    print(f"\n  SUCCESS: {len(segments)} aligned segments", flush=True)
+    for seg in segments[:3]:
+        print(f"    [{seg['start']:.2f}-{seg['end']:.2f}s] {seg['text'][:45]}")
+        for w in seg.get("words", [])[:4]:
+            print(f"      {w['start']:.2f}-{w['end']:.2f}: \"{w['word']}\"")
+    
+    # Save if output path specified
+    if output_path:
+        _write_json(output_path, segments)
+        print(f"  Saved: {output_path}", flush=True)
+    
+    return segments
 
 
 def _map_words_to_lines(all_words, original_lines, clean_lines):
     """
     Map aligned words back to original lyric lines, re-attaching punctuation.
+    Line i owns the aligned words between the cumulative clean-word counts
+    of the lines before it and through it.
     """
-    segments = []
-    word_idx = 0
+    n_aligned = len(all_words)
+    bounds = np.minimum(np.cumsum([0] + [len(cl.split()) for cl in clean_lines]), n_aligned).tolist()
+    starts = [round(w["start"], 2) for w in all_words]
+    ends = [round(w["end"], 2) for w in all_words]
     
-    for orig_line, clean_line in zip(original_lines, clean_lines):
-        clean_words_in_line = clean_line.split()
-        n_words = len(clean_words_in_line)
+    segments = []
+    for orig_line, lo, hi in zip(original_lines, bounds, bounds[1:]):
         orig_words_in_line = orig_line.split()
+        n_orig = len(orig_words_in_line)
         
-        seg_words = []
-        for i in range(n_words):
-            if word_idx < len(all_words):
-                w = all_words[word_idx].copy()
-                # Re-attach punctuation from original
-                if i < len(orig_words_in_line):
-                    w["word"] = orig_words_in_line[i]
-                w["start"] = round(w["start"], 2)
-                w["end"] = round(w["end"], 2)
-                seg_words.append(w)
-                word_idx += 1
+        # Re-attach punctuation from original
+        seg_words = [
+            {"word": orig_words_in_line[i - lo] if i - lo < n_orig else all_words[i]["word"],
+             "start": starts[i], "end": ends[i]}
+            for i in range(lo, hi)
+        ]
         
         if seg_words:
             segments.append({
                 "text": orig_line,
-                "start": seg_words[0]["start"],
-                "end": seg_words[-1]["end"],
+                "start": starts[lo],
+                "end": ends[hi - 1],
                 "words": seg_words
             })
         else:
@@ -416,11 +844,10 @@ if __name__ == "__main__":
             print(f"  Extracted lyrics from metadata file")
         except ImportError:
             # Manual extraction: just get Devanagari lines
-            import re
             lines = raw_text.split("\n")
             lyrics_text = "\n".join(
                 l.strip() for l in lines
-                if l.strip() and re.search(r'[\u0900-\u097F]', l)
+                if l.strip() and _DEVA_RE.search(l)
                 and not l.strip().startswith("[") and not l.strip().startswith("(")
             )
     else:
@@ -458,8 +885,7 @@ if __name__ == "__main__":
         from gemini_align import full_pipeline_gemini
         result = full_pipeline_gemini(audio_path, lyrics_text)
         if result:
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
+            _write_json(output_path, result)
             print(f"Gemini fallback: {len(result)} segments written to {output_path}")
         else:
             print("Both NeMo and Gemini failed.")
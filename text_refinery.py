@@ -1,5 +1,22 @@
 import os
+import re
+import copy
 import json
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+
+import numpy as np
+
+from json_utils import _loads, _dumps
+
+try:
+    import httpx  # optional: HTTP/2 multiplexes concurrent Gemini calls on one connection
+    import h2  # noqa: F401  (required by httpx for http2=True)
+except ImportError:
+    httpx = None
 
 # Language configuration for multi-language support
 LANGUAGE_CONFIG = {
@@ -11,6 +28,10 @@ LANGUAGE_CONFIG = {
 }
 
 
+# A "word" when counting words per lyric line: commas and dandas separate too
+_LINE_WORD_RE = re.compile(r"[^\s,।]+")
+
+
 def _split_segments_at_newlines(lyrics):
     """
     Splits any segment that contains newlines into separate segments (one per line).
@@ -22,8 +43,7 @@ def _split_segments_at_newlines(lyrics):
         text = seg.get("text", "")
         words = seg.get("words", [])
         
-        lines = text.split("\n")
-        lines = [l.strip() for l in lines if l.strip()]
+        lines = [l for l in map(str.strip, text.split("\n")) if l]
         
         # If only 1 line or no words, keep as-is
         if len(lines) <= 1 or not words:
@@ -31,10 +51,7 @@ def _split_segments_at_newlines(lyrics):
             continue
         
         # Count words per line based on whitespace splitting
-        line_word_counts = []
-        for line in lines:
-            line_words = line.replace(",", " ").replace("।", " ").split()
-            line_word_counts.append(len(line_words))
+        line_word_counts = [len(_LINE_WORD_RE.findall(line)) for line in lines]
         
         total_mapped = sum(line_word_counts)
         total_actual = len(words)
@@ -73,47 +90,81 @@ def _split_segments_at_newlines(lyrics):
     return result
 
 
-def _reattach_word_timestamps(refined_lyrics, raw_segments):
+def _word_attacher(raw_segments):
     """
-    Re-attaches word-level timestamps from the original segments
-    onto the Gemini-refined line-level lyrics by matching time ranges.
-    
-    For each refined line, finds all original words whose timestamps fall
-    within or overlap that line's [start, end] window.
+    Indexes the word timestamps of the original segments and returns
+    attach(line), which gives one refined line the original words whose
+    timestamps fall within or overlap its [start, end] window, sanitizes
+    them and returns the line. Returns None if there is no word data.
+    Lines are independent, so a streamed answer can be attached line by
+    line as it arrives.
     """
-    # Collect ALL words from raw segments into a flat list
-    all_words = []
+    # Collect ALL words from raw segments as parallel word/start/end columns;
+    # a word dict is only built once the word is matched to a line
+    texts, starts, ends = [], [], []
     for seg in raw_segments:
         for w in seg.get("words", []):
             if "start" in w and "end" in w and "word" in w:
-                all_words.append({
-                    "word": w["word"],
-                    "start": round(w["start"], 2),
-                    "end": round(w["end"], 2),
-                })
+                texts.append(w["word"])
+                starts.append(round(w["start"], 2))
+                ends.append(round(w["end"], 2))
     
-    if not all_words:
-        return refined_lyrics  # No word data available, return as-is
+    if not texts:
+        return None
     
     # Sort words by start time
-    all_words.sort(key=lambda w: w["start"])
+    starts = np.array(starts, dtype=np.float64)
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    ends = np.array(ends, dtype=np.float64)[order]
+    # Running max of end times: every word before the first index where it
+    # exceeds line_start ends at or before line_start
+    ends_max = np.maximum.accumulate(ends)
     
-    for line in refined_lyrics:
+    def attach(line):
         line_start = line.get("start", 0)
         line_end = line.get("end", 0)
         
         # Find words that overlap with this line's time range
         # A word overlaps if: word.start < line_end AND word.end > line_start
-        matched_words = [
-            w for w in all_words
-            if w["start"] < line_end and w["end"] > line_start
-        ]
+        lo = int(np.searchsorted(ends_max, line_start, side="right"))
+        hi = int(np.searchsorted(starts, line_end, side="left"))
+        if lo < hi:
+            matched = np.flatnonzero(ends[lo:hi] > line_start) + lo
+            if matched.size:
+                line["words"] = [
+                    {"word": texts[i], "start": start, "end": end}
+                    for i, start, end in zip(order[matched].tolist(), starts[matched].tolist(), ends[matched].tolist())
+                ]
         
-        if matched_words:
-            line["words"] = matched_words
+        # Sanitize word timestamps to fix unreasonable durations
+        words = line.get("words")
+        if words:
+            _sanitize_line_words(words, line_start, line_end)
+        return line
     
-    # Sanitize word timestamps to fix unreasonable durations
-    return _sanitize_word_timestamps(refined_lyrics)
+    return attach
+
+
+def _reattach_word_timestamps(refined_lyrics, raw_segments):
+    """
+    Re-attaches word-level timestamps from the original segments
+    onto the Gemini-refined line-level lyrics by matching time ranges.
+    
+    For each refined line, finds all original words whose timestamps fall
+    within or overlap that line's [start, end] window.
+    """
+    attach = _word_attacher(raw_segments)
+    if attach is None:
+        return refined_lyrics  # No word data available, return as-is
+    for line in refined_lyrics:
+        attach(line)
+    return refined_lyrics
+
+
+# Word-timestamp sanity limits for _sanitize_line_words
+_MAX_WORD_DURATION = 3.0  # seconds
+_GAP_THRESHOLD_RATIO = 0.5  # if first word takes > 50% of segment, redistribute
 
 
 def _sanitize_word_timestamps(lyrics):
@@ -124,106 +175,372 @@ def _sanitize_word_timestamps(lyrics):
        redistributes them evenly across the segment.
     3. Ensures words are sorted by start time within each segment.
     """
-    MAX_WORD_DURATION = 3.0  # seconds
-    GAP_THRESHOLD_RATIO = 0.5  # if first word takes > 50% of segment, redistribute
-    
     for line in lyrics:
         words = line.get("words")
-        if not words or len(words) == 0:
-            continue
-        
-        line_start = line.get("start", 0)
-        line_end = line.get("end", 0)
-        segment_duration = line_end - line_start
-        
-        if segment_duration <= 0:
-            continue
-        
-        # Sort words by start time
+        if words:
+            _sanitize_line_words(words, line.get("start", 0), line.get("end", 0))
+    return lyrics
+
+
+def _sanitize_line_words(words, line_start, line_end):
+    """_sanitize_word_timestamps for one line's words (fixed in place)."""
+    segment_duration = line_end - line_start
+    if segment_duration <= 0:
+        return
+    
+    # Sort words by start time (lists from _reattach_word_timestamps are
+    # already in order, so this is normally just the check)
+    if any(a["start"] > b["start"] for a, b in zip(words, words[1:])):
         words.sort(key=lambda w: w["start"])
+    
+    # Well-aligned line (the common case): nothing to cap or redistribute
+    if max(w["end"] - w["start"] for w in words) <= _MAX_WORD_DURATION:
+        return
+    
+    # Check if the first word has an unreasonably long duration
+    first_word = words[0]
+    first_word_duration = first_word["end"] - first_word["start"]
+    
+    if first_word_duration > _MAX_WORD_DURATION and len(words) > 1:
+        # The first word is too long - likely a misalignment.
+        # Check if words are bunched at the end
+        second_word_start = words[1]["start"]
+        gap_before_second = second_word_start - line_start
         
-        # Check if the first word has an unreasonably long duration
-        first_word = words[0]
-        first_word_duration = first_word["end"] - first_word["start"]
-        
-        if first_word_duration > MAX_WORD_DURATION and len(words) > 1:
-            # The first word is too long - likely a misalignment.
-            # Check if words are bunched at the end
-            second_word_start = words[1]["start"]
-            gap_before_second = second_word_start - line_start
+        if gap_before_second > segment_duration * _GAP_THRESHOLD_RATIO:
+            # Words are bunched at the end. Redistribute evenly.
+            actual_singing_start = second_word_start - 0.5  # Give a small lead-in
+            actual_singing_start = max(actual_singing_start, line_start)
+            total_singing_duration = line_end - actual_singing_start
+            word_slot = total_singing_duration / len(words)
             
-            if gap_before_second > segment_duration * GAP_THRESHOLD_RATIO:
-                # Words are bunched at the end. Redistribute evenly.
-                actual_singing_start = second_word_start - 0.5  # Give a small lead-in
-                actual_singing_start = max(actual_singing_start, line_start)
-                total_singing_duration = line_end - actual_singing_start
-                word_slot = total_singing_duration / len(words)
-                
-                for i, w in enumerate(words):
-                    w["start"] = round(actual_singing_start + i * word_slot, 2)
-                    w["end"] = round(w["start"] + min(word_slot * 0.9, MAX_WORD_DURATION), 2)
-                    w["end"] = min(w["end"], line_end)
-                
-                print(f"  [SANITIZE] Redistributed {len(words)} words in segment {line_start:.1f}-{line_end:.1f}s (was bunched)", flush=True)
-                line["words"] = words
-                continue
-            else:
-                # Just cap the first word's duration
-                first_word["end"] = round(first_word["start"] + MAX_WORD_DURATION, 2)
-                print(f"  [SANITIZE] Capped word '{first_word['word']}' from {first_word_duration:.1f}s to {MAX_WORD_DURATION}s", flush=True)
-        
-        # Cap any remaining words that are too long
-        for w in words:
-            dur = w["end"] - w["start"]
-            if dur > MAX_WORD_DURATION:
-                w["end"] = round(w["start"] + MAX_WORD_DURATION, 2)
-        
-        line["words"] = words
+            for i, w in enumerate(words):
+                w["start"] = round(actual_singing_start + i * word_slot, 2)
+                w["end"] = round(w["start"] + min(word_slot * 0.9, _MAX_WORD_DURATION), 2)
+                w["end"] = min(w["end"], line_end)
+            
+            print(f"  [SANITIZE] Redistributed {len(words)} words in segment {line_start:.1f}-{line_end:.1f}s (was bunched)", flush=True)
+            return
+        else:
+            # Just cap the first word's duration
+            first_word["end"] = round(first_word["start"] + _MAX_WORD_DURATION, 2)
+            print(f"  [SANITIZE] Capped word '{first_word['word']}' from {first_word_duration:.1f}s to {_MAX_WORD_DURATION}s", flush=True)
     
-    return lyrics
+    # Cap any remaining words that are too long
+    for w in words:
+        if w["end"] - w["start"] > _MAX_WORD_DURATION:
+            w["end"] = round(w["start"] + _MAX_WORD_DURATION, 2)
 
-def refine_lyrics_with_gemini(raw_segments, language="hi", api_key=None):
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        print(f"WARNING: Ignoring invalid {name}={os.environ.get(name)!r}", flush=True)
+        return default
+
+
+# (connect, read) timeout for Gemini calls; a hung connection otherwise
+# blocks its fallback slot forever
+_REQUEST_TIMEOUT = (5, 120) if httpx is None else httpx.Timeout(120, connect=5)
+_MAX_CONCURRENCY = max(1, _env_int("GEMINI_MAX_CONCURRENCY", 8))
+
+
+@lru_cache(maxsize=1)
+def _http_session():
     """
-    Uses Google Gemini to correct lyrics in native script (Devanagari for Hindi/Marathi),
-    add punctuation for readability, and group into max 2 poetic lines per segment.
+    Keep-alive client shared by the Gemini model fallback loops, hedged
+    races and batch threads. With httpx installed all of them share one
+    HTTP/2 connection; otherwise a requests Session whose pool is sized to
+    the concurrency cap, so no connection is discarded and re-handshaken.
     """
-    lang_cfg = LANGUAGE_CONFIG.get(language, {"name": language.upper(), "script_note": f"{language} → Latin (Roman) phonetics"})
-    language_name = lang_cfg["name"]
-    script_note = lang_cfg["script_note"]
+    if httpx is not None:
+        client = httpx.Client(http2=True, timeout=_REQUEST_TIMEOUT,
+                              limits=httpx.Limits(max_keepalive_connections=_MAX_CONCURRENCY))
+    else:
+        import requests
+        client = requests.Session()
+        client.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=_MAX_CONCURRENCY))
+    atexit.register(client.close)
+    return client
+
+
+class _RateLimiter:
+    """Spaces calls at least 60/rpm seconds apart across all threads."""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Shared by every refine/inject call in the process (including the
+# GeminiBatchProcessor threads): caps requests in flight and paces them
+# under the account's requests-per-minute quota instead of hitting 429s
+_CONCURRENCY = threading.BoundedSemaphore(_MAX_CONCURRENCY)
+_RATE_LIMITER = _RateLimiter(_env_int("GEMINI_RPM", 60))
+_MAX_RETRY_AFTER = 60.0
+
+
+def _retry_after(response):
+    """Seconds to wait before retrying a 429, from Retry-After or Gemini's RetryInfo; None if absent."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return min(float(header), _MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    try:
+        for detail in response.json().get("error", {}).get("details", []):
+            delay = detail.get("retryDelay")
+            if delay and delay.endswith("s"):
+                return min(float(delay[:-1]), _MAX_RETRY_AFTER)
+    except (ValueError, AttributeError):
+        pass
+    return None
 
-    print(f"--- Refining {language_name} lyrics using Gemini 1.5 Pro-002 ---", flush=True)
-    
-    # Configure API key
-    key = api_key or os.environ.get("GEMINI_API_KEY")
-    if not key:
-        print("Error: No Gemini API key found. Set GEMINI_API_KEY environment variable or pass api_key parameter.", flush=True)
+
+def _post_gemini(session, url, headers, data, max_429_retries=2):
+    """
+    POST a Gemini request through the shared limiter and concurrency cap.
+    A 429 that says how long to back off is retried after that delay;
+    anything else is returned to the caller (which moves on to its next model).
+    """
+    for attempt in range(max_429_retries + 1):
+        _RATE_LIMITER.wait()
+        with _CONCURRENCY:
+            response = session.post(url, headers=headers, json=data, timeout=_REQUEST_TIMEOUT)
+        if response.status_code != 429 or attempt == max_429_retries:
+            return response
+        delay = _retry_after(response)
+        if delay is None:
+            return response
+        print(f"Rate limited (429), retrying in {delay:.0f}s...", flush=True)
+        time.sleep(delay)
+    return response
+
+
+def _sse_text_parts(lines, model_name):
+    """Yield the candidate text parts from Gemini SSE lines; stops on a blocked prompt."""
+    for line in lines:
+        if not line.startswith("data:"):
+            continue
+        event = _loads(line[5:])
+        candidates = event.get("candidates")
+        if not candidates:
+            feedback = event.get("promptFeedback")
+            if feedback:
+                print(f"Safety Block on {model_name}: {feedback}", flush=True)
+                return
+            continue
+        for part in candidates[0].get("content", {}).get("parts", []):
+            if part.get("text"):
+                yield part["text"]
+
+
+def _stream_gemini(session, url, headers, data, model_name, max_429_retries=2):
+    """
+    Streaming counterpart of _post_gemini for a streamGenerateContent?alt=sse
+    url: yields the answer text as it is generated. Paced and capped the same
+    way (the concurrency slot is held until the stream ends); a non-200
+    status is logged and ends the stream with nothing yielded.
+    """
+    for attempt in range(max_429_retries + 1):
+        _RATE_LIMITER.wait()
+        with _CONCURRENCY:
+            if httpx is not None:
+                with session.stream("POST", url, headers=headers, json=data) as response:
+                    if response.status_code == 200:
+                        yield from _sse_text_parts(response.iter_lines(), model_name)
+                        return
+                    response.read()
+            else:
+                with session.post(url, headers=headers, json=data, timeout=_REQUEST_TIMEOUT, stream=True) as response:
+                    if response.status_code == 200:
+                        # SSE is UTF-8; requests would guess ISO-8859-1 for text/event-stream
+                        yield from _sse_text_parts((l.decode("utf-8") for l in response.iter_lines()), model_name)
+                        return
+                    response.content  # read the error body (RetryInfo) before the stream closes
+        delay = _retry_after(response) if response.status_code == 429 and attempt < max_429_retries else None
+        if delay is None:
+            print(f"Model {model_name} failed with status {response.status_code}: {response.text[:100]}...", flush=True)
+            return
+        print(f"Rate limited (429), retrying in {delay:.0f}s...", flush=True)
+        time.sleep(delay)
+
+
+class _JsonArrayStream:
+    """
+    Incremental parser for a JSON array arriving in text chunks (e.g. a
+    streamed Gemini answer). feed() returns the array items completed by the
+    new chunk; anything before the first '[' (such as a ```json fence) is
+    skipped, and done turns True once the closing ']' has been seen. Call
+    close() at the end of the stream to pick up anything still pending.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._started = False
+        self.done = False
+
+    def feed(self, chunk):
+        if self.done:
+            return []
+        buf = self._buf + chunk
+        if not self._started:
+            start = buf.find("[")
+            if start == -1:
+                self._buf = ""
+                return []
+            buf = buf[start + 1:]
+            self._started = True
+        # An item (or the array) can only have just completed if the chunk
+        # ends on a closing bracket; otherwise skip the decode attempt, which
+        # would re-scan the pending item and fail again
+        if chunk.rstrip()[-1:] not in ("}", "]"):
+            self._buf = buf
+            return []
+        return self._drain(buf)
+
+    def close(self):
+        """Decode whatever is still buffered; returns the remaining items."""
+        if self.done or not self._started:
+            return []
+        return self._drain(self._buf)
+
+    def _drain(self, buf):
+        items = []
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buf):
+                break
+            if buf[pos] == "]":
+                self.done = True
+                break
+            try:
+                item, pos = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # item not complete yet
+            items.append(item)
+        # Only the unfinished tail is kept for the next chunk
+        self._buf = buf[pos:]
+        return items
+
+
+def _hedge_delay():
+    """
+    Seconds before a backup model is also asked (GEMINI_HEDGE_DELAY). Unset by
+    default: a full-song answer often takes longer than any short delay, and
+    every hedge is a second billed request.
+    """
+    try:
+        return float(os.environ["GEMINI_HEDGE_DELAY"])
+    except (KeyError, ValueError):
         return None
-    
-    # Define fallback models in order of preference
-    # Using REST API to avoid gRPC/SDK crashes in this environment
-    import requests
-    
-    models_to_try = [
-        "gemini-2.5-flash",
-        "gemini-2.0-flash-exp", # If available
-        "gemini-1.5-pro-002",
-        "gemini-1.5-flash",
-        "gemini-pro"
-    ]
 
+
+def _hedged_call(models, call, hedge_delay):
+    """
+    Fallback over models: call(models[0]) runs first and the next model is
+    started as soon as a running attempt fails. With a hedge_delay, the
+    second model is also started once that many seconds pass without an
+    answer (only once, so at most two requests are in flight). Returns the
+    first non-None result, or None if every model comes back empty. Slower
+    attempts still in flight are abandoned.
+    """
+    backups = list(models)
+    pool = ThreadPoolExecutor(max_workers=2)
+    try:
+        pending = {pool.submit(call, backups.pop(0))}
+        hedged = hedge_delay is None
+        while pending:
+            done, pending = wait(pending, timeout=None if hedged or not backups else hedge_delay,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is not None:
+                    return result
+            if backups:
+                model_name = backups.pop(0)
+                if not done:
+                    hedged = True
+                    print(f"No answer after {hedge_delay:.0f}s, also asking {model_name}...", flush=True)
+                pending.add(pool.submit(call, model_name))
+        return None
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Refine fallback models in order of preference
+_REFINE_MODELS = [
+    "gemini-2.5-flash",
+    "gemini-2.0-flash-exp", # If available
+    "gemini-1.5-pro-002",
+    "gemini-1.5-flash",
+    "gemini-pro"
+]
+
+# Rough cap on the segment JSON packed into one refine_lyrics_batch request
+_BATCH_MAX_BYTES = 30_000
+
+# Forces refine/inject answers into a bare [{start, end, text}] array, so
+# they parse directly without markdown or bracket salvage
+_LINES_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "start": {"type": "NUMBER"},
+            "end": {"type": "NUMBER"},
+            "text": {"type": "STRING"},
+        },
+        "required": ["start", "end", "text"],
+    },
+}
+
+# Forces refine_lyrics_batch answers into [{"sid", "lines": [{start, end, text}]}]
+_BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "sid": {"type": "INTEGER"},
+            "lines": _LINES_SCHEMA,
+        },
+        "required": ["sid", "lines"],
+    },
+}
+
+
+def _refine_segment_data(raw_segments):
+    """Per-segment text plus the span actually sung (from word timestamps), as sent to Gemini."""
     segment_data = []
     for seg in raw_segments:
         # Detect the ACTUAL start and end of singing within this segment
         # ignore leading/trailing instrumental silence
-        words = seg.get("words", [])
-        active_starts = [w["start"] for w in words if "start" in w]
-        active_ends = [w["end"] for w in words if "end" in w]
+        # Revert to tighter timings (removed lead-in and hang-time to fix "fast" feeling):
+        # one pass keeping the earliest word start and latest word end
+        actual_start = actual_end = None
+        for w in seg.get("words", []):
+            if "start" in w and (actual_start is None or w["start"] < actual_start):
+                actual_start = w["start"]
+            if "end" in w and (actual_end is None or w["end"] > actual_end):
+                actual_end = w["end"]
         
-        if active_starts and active_ends:
-            # Revert to tighter timings (removed lead-in and hang-time to fix "fast" feeling)
-            actual_start = min(active_starts)
-            actual_end = max(active_ends)
-        else:
+        if actual_start is None or actual_end is None:
             actual_start = seg["start"]
             actual_end = seg["end"]
 
@@ -232,8 +549,18 @@ def refine_lyrics_with_gemini(raw_segments, language="hi", api_key=None):
             "start": round(actual_start, 2),
             "end": round(actual_end, 2)
         })
+    return segment_data
 
-    prompt = f"""
+
+@lru_cache(maxsize=8)
+def _refine_system_prompt(language_name, script_note):
+    """
+    Static refine rules, sent as systemInstruction so every call for a
+    language shares an identical prefix (eligible for Gemini's implicit
+    prompt caching); only the segment data differs per song. Built once per
+    language.
+    """
+    return f"""
 You are an expert {language_name} lyricist. I will provide you with the EXACT timestamps when the singer is singing during each segment of a {language_name} song.
 
 YOUR TASK:
@@ -251,81 +578,196 @@ CRITICAL RULES:
 - Use `"text"` as the key for the lyric content (e.g., {{"start": 0.0, "end": 2.0, "text": "..."}}).
 - Return ONLY a JSON array.
 - Output in NATIVE SCRIPT, not Latin.
+"""
+
 
+def refine_lyrics_with_gemini(raw_segments, language="hi", api_key=None):
+    """
+    Uses Google Gemini to correct lyrics in native script (Devanagari for Hindi/Marathi),
+    add punctuation for readability, and group into max 2 poetic lines per segment.
+    """
+    lang_cfg = LANGUAGE_CONFIG.get(language, {"name": language.upper(), "script_note": f"{language} → Latin (Roman) phonetics"})
+    language_name = lang_cfg["name"]
+    script_note = lang_cfg["script_note"]
+
+    print(f"--- Refining {language_name} lyrics using Gemini 1.5 Pro-002 ---", flush=True)
+    
+    # Configure API key
+    key = api_key or os.environ.get("GEMINI_API_KEY")
+    if not key:
+        print("Error: No Gemini API key found. Set GEMINI_API_KEY environment variable or pass api_key parameter.", flush=True)
+        return None
+    
+    # Using REST API to avoid gRPC/SDK crashes in this environment
+    models_to_try = _REFINE_MODELS
+
+    segment_data = _refine_segment_data(raw_segments)
+    system_prompt = _refine_system_prompt(language_name, script_note)
+
+    prompt = f"""
 Segment-Level Input Data:
-{json.dumps(segment_data, ensure_ascii=False)}
+{_dumps(segment_data)}
 """
 
-    refined_lyrics = None
+    # Identical segment text/timings -> identical Gemini answer; the raw
+    # answer is cached and word timestamps are re-attached on every run
+    from gemini_cache import cache_key, cache_get, cache_put
+    refine_key = cache_key(language, _dumps(segment_data, sort_keys=True))
+    cached = cache_get("refine", refine_key)
+    if cached is not None:
+        print("Using cached Gemini refinement", flush=True)
+        refined_lyrics = _reattach_word_timestamps(copy.deepcopy(cached), raw_segments)
+        return _split_segments_at_newlines(refined_lyrics)
+    
+    session = _http_session()
+    attach = _word_attacher(raw_segments)
     
-    for model_name in models_to_try:
+    def refine_with(model_name):
         print(f"Attempting refinement with model: {model_name}...", flush=True)
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={key}"
+        # Streamed, so the answer is parsed line by line while it is still
+        # being generated rather than in one pass after the last byte
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:streamGenerateContent?alt=sse&key={key}"
         headers = {"Content-Type": "application/json"}
         data = {
+            "systemInstruction": {"parts": [{"text": system_prompt}]},
             "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {"response_mime_type": "application/json"}
+            "generationConfig": {"response_mime_type": "application/json",
+                                 "responseSchema": _LINES_SCHEMA}
         }
         
         try:
-            response = requests.post(url, headers=headers, json=data)
-            
-            if response.status_code != 200:
-                print(f"Model {model_name} failed with status {response.status_code}: {response.text[:100]}...", flush=True)
-                continue # Try next model
-                
-            # Parse response
-            result_json = response.json()
-            candidates = result_json.get('candidates', [])
-            if not candidates:
-                 try:
-                    # Check for prompt feedback block
-                    feedback = result_json.get('promptFeedback', {})
-                    if feedback:
-                        print(f"Safety Block on {model_name}: {feedback}", flush=True)
-                    else:
-                        print(f"No candidates returned from {model_name}.", flush=True)
-                 except: 
-                     pass
-                 continue
-
-            text_response = candidates[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-            
-            if not text_response:
-                continue
-
-            text_response = text_response.strip()
-            # Clean markdown
-            if text_response.startswith("```json"):
-                text_response = text_response[7:-3].strip()
-            elif text_response.startswith("```"):
-                text_response = text_response[3:-3].strip()
-
-            # Parse JSON
-            try:
-                # Find brackets
-                start_idx = text_response.find('[')
-                end_idx = text_response.rfind(']') + 1
-                if start_idx != -1 and end_idx != 0:
-                    json_str = text_response[start_idx:end_idx]
-                    refined_lyrics = json.loads(json_str)
-                    # Re-attach word-level timestamps from the original segments
-                    refined_lyrics = _reattach_word_timestamps(refined_lyrics, raw_segments)
-                    refined_lyrics = _split_segments_at_newlines(refined_lyrics)
-                    print(f"SUCCESS: Refined lyrics generated using {model_name} (with word timestamps)", flush=True)
-                    return refined_lyrics
-                else:
-                    print(f"Failed to parse JSON from {model_name}", flush=True)
-            except json.JSONDecodeError:
-                 print(f"JSON Decode Error from {model_name}", flush=True)
+            parser = _JsonArrayStream()
+            gemini_lines = []
+            refined_lyrics = []
+            for text_part in _stream_gemini(session, url, headers, data, model_name):
+                for line in parser.feed(text_part):
+                    gemini_lines.append(dict(line))
+                    # Re-attach word-level timestamps from the original
+                    # segments while the rest of the answer is still streaming
+                    refined_lyrics.append(attach(line) if attach else line)
+                if parser.done:
+                    break
+            for line in parser.close():
+                gemini_lines.append(dict(line))
+                refined_lyrics.append(attach(line) if attach else line)
+
+            if not parser.done:
+                print(f"Failed to parse JSON from {model_name}", flush=True)
+                return None
+            if gemini_lines:
+                cache_put("refine", refine_key, gemini_lines)
+            refined_lyrics = _split_segments_at_newlines(refined_lyrics)
+            print(f"SUCCESS: Refined lyrics generated using {model_name} (with word timestamps)", flush=True)
+            return refined_lyrics
                  
         except Exception as e:
             print(f"Error calling {model_name}: {e}", flush=True)
+        return None
+    
+    # Staggered race down the fallback list: a slow or failing model no
+    # longer stalls the ones after it
+    refined_lyrics = _hedged_call(models_to_try, refine_with, _hedge_delay())
+    if refined_lyrics is not None:
+        return refined_lyrics
             
     print("ALL MODELS FAILED. Returning None (fallback to raw).", flush=True)
     return None
 
 
+def refine_lyrics_batch(raw_segment_lists, language="hi", api_key=None):
+    """
+    Refine several songs with as few Gemini requests as possible: songs are
+    packed (up to ~_BATCH_MAX_BYTES of segment JSON per request) under a song
+    id, and the model answers with one {"sid", "lines"} entry per song.
+    Returns a list parallel to raw_segment_lists with what
+    refine_lyrics_with_gemini would return for each song; songs missing from
+    a batched answer are refined on their own.
+    """
+    lang_cfg = LANGUAGE_CONFIG.get(language, {"name": language.upper(), "script_note": f"{language} → Latin (Roman) phonetics"})
+    language_name = lang_cfg["name"]
+    
+    key = api_key or os.environ.get("GEMINI_API_KEY")
+    if not key:
+        print("Error: No Gemini API key found. Set GEMINI_API_KEY environment variable or pass api_key parameter.", flush=True)
+        return [None] * len(raw_segment_lists)
+    
+    from gemini_cache import cache_key, cache_get, cache_put
+    
+    results = [None] * len(raw_segment_lists)
+    answers = {}
+    
+    # Songs with a cached answer need no request; pack the rest
+    batches, batch, batch_bytes = [], [], 0
+    for sid, raw_segments in enumerate(raw_segment_lists):
+        segment_data = _refine_segment_data(raw_segments)
+        refine_key = cache_key(language, _dumps(segment_data, sort_keys=True))
+        cached = cache_get("refine", refine_key)
+        if cached is not None:
+            answers[sid] = copy.deepcopy(cached)
+            continue
+        size = len(_dumps(segment_data).encode("utf-8"))
+        if batch and batch_bytes + size > _BATCH_MAX_BYTES:
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append((sid, refine_key, segment_data))
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    
+    system_prompt = _refine_system_prompt(language_name, lang_cfg["script_note"]) + """
+BATCH MODE:
+- The input contains several songs, each with a "sid" and its "segments".
+- Apply all rules above to every song independently.
+- Return a JSON array with one object per song: {"sid": <sid>, "lines": [<the JSON array you would return for that song>]}.
+"""
+    session = _http_session()
+    
+    for batch in batches:
+        if len(batch) == 1:
+            continue  # a lone song goes through the normal single-song path below
+        print(f"--- Refining {len(batch)} {language_name} songs in one Gemini request ---", flush=True)
+        prompt = _dumps({"songs": [{"sid": sid, "segments": data} for sid, _, data in batch]})
+        
+        def refine_batch_with(model_name, prompt=prompt):
+            print(f"Attempting batch refinement with model: {model_name}...", flush=True)
+            url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={key}"
+            headers = {"Content-Type": "application/json"}
+            data = {
+                "systemInstruction": {"parts": [{"text": system_prompt}]},
+                "contents": [{"parts": [{"text": prompt}]}],
+                "generationConfig": {"response_mime_type": "application/json",
+                                     "responseSchema": _BATCH_RESPONSE_SCHEMA}
+            }
+            try:
+                response = _post_gemini(session, url, headers, data)
+                if response.status_code != 200:
+                    print(f"Model {model_name} failed with status {response.status_code}: {response.text[:100]}...", flush=True)
+                    return None
+                text_response = _loads(response.content)['candidates'][0]['content']['parts'][0]['text']
+                songs = _loads(text_response)
+                return {int(song["sid"]): song["lines"] for song in songs if song.get("lines")}
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                print(f"Unusable batch answer from {model_name}: {e}", flush=True)
+            except Exception as e:
+                print(f"Error calling {model_name}: {e}", flush=True)
+            return None
+        
+        by_sid = _hedged_call(_REFINE_MODELS, refine_batch_with, _hedge_delay()) or {}
+        for sid, refine_key, _ in batch:
+            if sid in by_sid:
+                cache_put("refine", refine_key, by_sid[sid])
+                answers[sid] = by_sid[sid]
+    
+    for sid, raw_segments in enumerate(raw_segment_lists):
+        if sid in answers:
+            refined_lyrics = _reattach_word_timestamps(answers[sid], raw_segments)
+            results[sid] = _split_segments_at_newlines(refined_lyrics)
+        else:
+            # Not in any batched answer: fall back to a single-song request
+            results[sid] = refine_lyrics_with_gemini(raw_segments, language=language, api_key=key)
+    return results
+
+
 def inject_lyrics_with_gemini(timing_shell, ground_truth, language="hi", api_key=None):
     """
     Step 7 of the Injection Protocol: Maps ground truth lyrics to the AI timing shell.
@@ -339,18 +781,12 @@ def inject_lyrics_with_gemini(timing_shell, ground_truth, language="hi", api_key
     if not key:
         return None
 
-    import requests
-
-    prompt = f"""
+    # Static rules as systemInstruction (shared, cacheable prefix); the
+    # ground truth and timing shell are the per-song message
+    system_prompt = """
 You are a professional lyric video editor. 
 I have a 'Timing Shell' (AI-heard segments with timestamps) and 'Ground Truth Lyrics' (the correct text).
 
-GROUND TRUTH (USE THESE EXACT WORDS — DO NOT CHANGE ANYTHING):
-{ground_truth}
-
-TIMING SHELL (AI interpreted segments with word-level evidence):
-{json.dumps(timing_shell, indent=2, ensure_ascii=False)}
-
 TASK:
 Map the GROUND TRUTH text to the TIMING SHELL timestamps.
 
@@ -373,40 +809,52 @@ EXAMPLE OF WHAT IS FORBIDDEN:
 - Do NOT transliterate to Latin/Roman script
 """
 
+    prompt = f"""
+GROUND TRUTH (USE THESE EXACT WORDS — DO NOT CHANGE ANYTHING):
+{ground_truth}
+
+TIMING SHELL (AI interpreted segments with word-level evidence):
+{_dumps(timing_shell, indent=True)}
+"""
+
+    from gemini_cache import cache_key, cache_get, cache_put
+    inject_key = cache_key(language, ground_truth, _dumps(timing_shell, sort_keys=True))
+    cached = cache_get("inject", inject_key)
+    if cached is not None:
+        print("Using cached Gemini injection", flush=True)
+        injected_lyrics = _reattach_word_timestamps(copy.deepcopy(cached), timing_shell)
+        return _split_segments_at_newlines(injected_lyrics)
+
     models_to_try = ["gemini-2.5-flash", "gemini-1.5-pro-002", "gemini-1.5-flash"]
+    session = _http_session()
     
-    for model_name in models_to_try:
+    def inject_with(model_name):
         print(f"Attempting injection with model: {model_name}...", flush=True)
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={key}"
         headers = {"Content-Type": "application/json"}
         data = {
+            "systemInstruction": {"parts": [{"text": system_prompt}]},
             "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {"response_mime_type": "application/json"}
+            "generationConfig": {"response_mime_type": "application/json",
+                                 "responseSchema": _LINES_SCHEMA}
         }
         
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = _post_gemini(session, url, headers, data)
             if response.status_code == 200:
-                result_json = response.json()
-                text_response = result_json['candidates'][0]['content']['parts'][0]['text'].strip()
-                
-                # Clean markdown
-                if text_response.startswith("```json"):
-                    text_response = text_response[7:-3].strip()
-                elif text_response.startswith("```"):
-                    text_response = text_response[3:-3].strip()
-
-                start_idx = text_response.find('[')
-                end_idx = text_response.rfind(']') + 1
-                if start_idx != -1 and end_idx != 0:
-                    injected_lyrics = json.loads(text_response[start_idx:end_idx])
-                    # Re-attach word-level timestamps from the timing shell
-                    injected_lyrics = _reattach_word_timestamps(injected_lyrics, timing_shell)
-                    injected_lyrics = _split_segments_at_newlines(injected_lyrics)
-                    return injected_lyrics
+                result_json = _loads(response.content)
+                text_response = result_json['candidates'][0]['content']['parts'][0]['text']
+                injected_lyrics = _loads(text_response)
+                if injected_lyrics:
+                    cache_put("inject", inject_key, injected_lyrics)
+                # Re-attach word-level timestamps from the timing shell
+                injected_lyrics = _reattach_word_timestamps(injected_lyrics, timing_shell)
+                injected_lyrics = _split_segments_at_newlines(injected_lyrics)
+                return injected_lyrics
             else:
                 print(f"Model {model_name} failed: {response.status_code}")
         except Exception as e:
             print(f"Error with {model_name}: {e}")
+        return None
 
-    return None
+    return _hedged_call(models_to_try, inject_with, _hedge_delay())
@@ -0,0 +1,79 @@
+"""
+Text Refinery Batch
+===================
+Runs many refine/inject Gemini requests concurrently instead of one song at
+a time. Each request is network-bound, so a small thread pool overlaps their
+round-trips; the pool size caps how many are in flight against the API.
+
+Usage:
+    with GeminiBatchProcessor(max_concurrency=8) as processor:
+        jobs = [processor.submit_refine(segments) for segments in songs]
+        refined = [job.result() for job in jobs]
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from text_refinery import refine_lyrics_with_gemini, inject_lyrics_with_gemini
+
+
+class GeminiBatchProcessor:
+    """
+    Thread-pool front end for refine_lyrics_with_gemini and
+    inject_lyrics_with_gemini. submit_* returns a Future whose result is what
+    the wrapped function returns (a lyrics list, or None if every model failed).
+    Without a Gemini API key every job resolves to None straight away.
+    """
+
+    def __init__(self, max_concurrency=8, max_retries=2, backoff=2.0, api_key=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Resolved once: with no key there is no model to reach, so the jobs
+        # skip the calls (and their retry back-off) entirely
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        if not self.api_key:
+            print("Error: No Gemini API key found. Set GEMINI_API_KEY environment variable or pass api_key parameter.", flush=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini-batch")
+
+    def submit_refine(self, raw_segments, language="hi"):
+        """Queue a refine_lyrics_with_gemini call. Returns a Future."""
+        return self._pool.submit(self._run, refine_lyrics_with_gemini,
+                                 raw_segments, language=language, api_key=self.api_key)
+
+    def submit_inject(self, timing_shell, ground_truth, language="hi"):
+        """Queue an inject_lyrics_with_gemini call. Returns a Future."""
+        return self._pool.submit(self._run, inject_lyrics_with_gemini,
+                                 timing_shell, ground_truth, language=language, api_key=self.api_key)
+
+    def refine_all(self, segment_lists, language="hi"):
+        """Refine several songs' segments concurrently; results keep input order."""
+        jobs = [self.submit_refine(segments, language) for segments in segment_lists]
+        return [job.result() for job in jobs]
+
+    def _run(self, fn, *args, **kwargs):
+        if not self.api_key:
+            return None
+        # With a key, None means the wrapped function reached the API and
+        # every model in its fallback list failed (usually 429/overload when
+        # many requests run at once), so back off and retry the whole call.
+        for attempt in range(self.max_retries + 1):
+            result = fn(*args, **kwargs)
+            if result is not None:
+                return result
+            if attempt < self.max_retries:
+                delay = self.backoff * (2 ** attempt)
+                print(f"  {fn.__name__} returned nothing, retrying in {delay:.0f}s "
+                      f"({attempt + 1}/{self.max_retries})...", flush=True)
+                time.sleep(delay)
+        return None
+
+    def close(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -1,12 +1,26 @@
 import whisperx
-import json
 import torch
+import numpy as np
 import os
 import requests
 import re
+import gc
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from whisperx.vads.pyannote import load_vad_model, Binarize
 
+from json_utils import _loads, _dumps
+
+try:
+    import httpx  # optional: HTTP/2 keep-alive client for the Gemini check
+    import h2  # noqa: F401  (required by httpx for http2=True)
+except ImportError:
+    httpx = None
+
 # Fix for Torch 2.6+ security restriction. 
 # WhisperX alignment models currently use classes (like omegaconf) that Torch 2.6 restricts by default.
 os.environ["TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD"] = "1"
@@ -20,15 +34,204 @@ CUSTOM_ALIGN_MODELS = {
     "gu": "MahmoudAshraf/mms-300m-1130-forced-aligner",
 }
 
-def transcribe_and_align(audio_path, language="hi", device="cpu", device_index=0, model_name="large-v2", lyrics_text=None):
+# Languages the pipeline handles; a Whisper guess outside these, or below
+# the confidence threshold, is double-checked with Gemini
+_VERIFIED_LANGUAGES = ("hi", "en", "gu", "mr", "pa")
+_CONFIDENT_LANGUAGE_PROB = 0.85
+
+# Language code in Gemini's verification answer, and whitespace runs in anchored lyrics
+_LANG_CODE_RE = re.compile(r'\b(hi|en|gu|mr|pa|bn|ta|te|kn)\b')
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Held around the cached loaders below so concurrent calls that miss the
+# cache wait for one load instead of each loading the same weights
+_MODEL_LOCK = threading.Lock()
+
+@lru_cache(maxsize=2)
+def _load_asr_model(model_name, device, device_index, compute_type):
+    """Whisper model, loaded once per process and reused by later calls."""
+    return whisperx.load_model(model_name, device, device_index=device_index, compute_type=compute_type)
+
+@lru_cache(maxsize=8)
+def _load_align_model(language, device):
+    """(alignment model, metadata) for a language, loaded once per process."""
+    align_kwargs = {"language_code": language, "device": device}
+    if language in CUSTOM_ALIGN_MODELS:
+        align_kwargs["model_name"] = CUSTOM_ALIGN_MODELS[language]
+    return whisperx.load_align_model(**align_kwargs)
+
+@lru_cache(maxsize=2)
+def _load_vad(device):
+    """pyannote VAD model used for language detection, loaded once per process."""
+    return load_vad_model(device, token=None)
+
+def release_models():
+    """Drops the cached Whisper/alignment/VAD models and returns their (V)RAM."""
+    with _MODEL_LOCK:
+        _load_asr_model.cache_clear()
+        _load_align_model.cache_clear()
+        _load_vad.cache_clear()
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def _align_workers(device, n_segments):
+    """
+    Worker processes for forced alignment: WHISPERX_ALIGN_WORKERS (opt-in,
+    default 1 = align in-process). Only used on CPU, where wav2vec2
+    alignment of a long song is the largest cost after transcription.
+    """
+    try:
+        workers = int(os.environ.get("WHISPERX_ALIGN_WORKERS", "1"))
+    except ValueError:
+        workers = 1
+    if device != "cpu":
+        return 1
+    return max(1, min(workers, n_segments))
+
+# Per-process state of an alignment worker (see _align_parallel)
+_ALIGN_WORKER = {}
+
+def _init_align_worker(language, audio, threads):
+    torch.set_num_threads(threads)
+    _ALIGN_WORKER["model"] = _load_align_model(language, "cpu")
+    _ALIGN_WORKER["audio"] = audio
+
+def _align_worker(segments):
+    model_a, metadata = _ALIGN_WORKER["model"]
+    with torch.inference_mode():
+        return whisperx.align(segments, model_a, metadata, _ALIGN_WORKER["audio"], "cpu", return_char_alignments=False)
+
+def _align_parallel(segments, language, audio, workers):
+    """
+    whisperx.align over contiguous slices of segments in worker processes
+    (each loads the alignment model once and gets an equal share of the
+    CPU threads). Results are merged back in segment order.
+    """
+    bounds = np.linspace(0, len(segments), workers + 1).astype(int)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # spawn: forking a process that already holds torch thread pools is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_align_worker,
+                             initargs=(language, audio, threads)) as pool:
+        parts = list(pool.map(_align_worker, [segments[a:b] for a, b in zip(bounds[:-1], bounds[1:])]))
+    return {
+        "segments": [seg for part in parts for seg in part["segments"]],
+        "word_segments": [w for part in parts for w in part.get("word_segments", [])],
+    }
+
+def _default_batch_size(device, device_index):
+    """
+    Chunks per batched Whisper step: 32 on GPUs with at least 12 GB,
+    8 on smaller cards and 16 on CPU. WHISPER_BATCH_SIZE overrides it.
+    """
+    try:
+        return int(os.environ["WHISPER_BATCH_SIZE"])
+    except (KeyError, ValueError):
+        pass
+    if device != "cuda":
+        return 16
+    vram = torch.cuda.get_device_properties(device_index).total_memory
+    return 32 if vram >= 12 * 1024**3 else 8
+
+def _detect_language(model, audio):
+    """
+    Whisper's (language, probability) for the first 30s of audio, computed
+    the way WhisperX's detect_language does it (which only returns the
+    code). probability is None if the faster-whisper internals differ.
+    """
+    try:
+        from whisperx.audio import log_mel_spectrogram, N_SAMPLES
+        n_mels = model.model.feat_kwargs.get("feature_size") or 80
+        segment = log_mel_spectrogram(audio[:N_SAMPLES], n_mels=n_mels,
+                                      padding=max(0, N_SAMPLES - audio.shape[0]))
+        encoder_output = model.model.encode(segment)
+        language_token, probability = model.model.model.detect_language(encoder_output)[0][0]
+        return language_token[2:-2], probability
+    except Exception:
+        return model.detect_language(audio), None
+
+# (connect, read) timeout so a stalled request cannot hang the pipeline
+_REQUEST_TIMEOUT = (5, 30) if httpx is None else httpx.Timeout(30, connect=5)
+
+@lru_cache(maxsize=1)
+def _http_session():
+    """
+    Keep-alive client for the Gemini language check, so a batch of songs
+    pays for one TLS handshake instead of one per file.
+    """
+    if httpx is not None:
+        client = httpx.Client(http2=True, timeout=_REQUEST_TIMEOUT,
+                              limits=httpx.Limits(max_keepalive_connections=4, max_connections=8))
+    else:
+        client = requests.Session()
+    atexit.register(client.close)
+    return client
+
+def _verify_language_gemini(rough_text, whisper_guess):
+    """
+    Asks Gemini 2.5 Flash for the language of a rough transcription snippet.
+    Returns the code to use: Gemini's answer if it is a supported language,
+    otherwise Whisper's guess.
+    """
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key or not rough_text.strip():
+        return whisper_guess
+
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
+    headers = {"Content-Type": "application/json"}
+    prompt = f"""Identify the most likely language of this song transcription snippet. 
+    Focus on vocabulary and grammar. 
+    Even if the transcription is messy, guess the primary language.
+    Return ONLY the ISO 639-1 code (e.g., 'hi', 'en', 'gu', 'mr', 'pa').
+    Snippet: "{rough_text}"
+    Whisper thinks it's: '{whisper_guess}'
+    Code:"""
+    
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"temperature": 0.0}
+    }
+    
+    # Pre-encoded body: httpx takes raw bytes as content=, requests as data=
+    payload = _dumps(payload).encode("utf-8")
+    body = {"content": payload} if httpx is not None else {"data": payload}
+    response = _http_session().post(url, headers=headers, timeout=_REQUEST_TIMEOUT, **body)
+    if response.status_code != 200:
+        print(f"Gemini verification failed (Status: {response.status_code}). Using Whisper guess.")
+        return whisper_guess
+
+    resp_json = _loads(response.content)
+    gemini_code = resp_json['candidates'][0]['content']['parts'][0]['text'].strip().lower()
+    # Clean up any extra text Gemini might have returned
+    if len(gemini_code) > 2:
+        match = _LANG_CODE_RE.search(gemini_code)
+        if match:
+            gemini_code = match.group(1)
+    
+    if gemini_code in _VERIFIED_LANGUAGES:
+        print(f"Gemini 2.5 Flash verified language: {gemini_code}")
+        return gemini_code
+    print(f"Gemini suggested code {gemini_code}, but sticking to Whisper's {whisper_guess} for stability.")
+    return whisper_guess
+
+def transcribe_and_align(audio_path, language="hi", device=None, device_index=0, model_name="large-v2", lyrics_text=None):
     """
     Transcribes audio and aligns word-level timestamps using WhisperX.
     Supports custom alignment models for languages without WhisperX defaults (e.g. Marathi).
+    device defaults to "cuda" when a GPU is available, else "cpu".
     """
     print(f"--- Starting transcription & alignment for: {audio_path} ---")
     
-    batch_size = 16 # reduce if low on VRAM
-    compute_type = "int8" # change to "float16" for GPU if supported
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    # WhisperX runs on faster-whisper (CTranslate2): int8 weights with
+    # float16 activations and bigger batches on GPU, plain int8 on CPU.
+    # WHISPER_COMPUTE_TYPE overrides it (e.g. "float16" to roll back).
+    # load_model returns WhisperX's batched (faster-whisper) pipeline, so
+    # 30s speech chunks go through the encoder batch_size at a time
+    batch_size = _default_batch_size(device, device_index)
+    compute_type = os.environ.get("WHISPER_COMPUTE_TYPE") or ("int8_float16" if device == "cuda" else "int8")
 
     print("Loading audio...")
     audio = whisperx.load_audio(audio_path)
@@ -44,7 +247,7 @@ def transcribe_and_align(audio_path, language="hi", device="cpu", device_index=0
         # We'll create a single dummy segment with the full text, 
         # allowing the aligner to break it down.
         # IMPORTANT: Replace newlines with spaces so words aren't glued together
-        clean_text = lyrics_text.replace("\n", " ").replace("  ", " ")
+        clean_text = _WHITESPACE_RE.sub(" ", lyrics_text)
         audio_duration = audio.shape[0] / 16000.0
         print(f"--- Audio Duration: {audio_duration:.2f} seconds ---")
         result = {"segments": [{"text": clean_text, "start": 0.0, "end": audio_duration}]}
@@ -53,7 +256,8 @@ def transcribe_and_align(audio_path, language="hi", device="cpu", device_index=0
         # Standard Transcription with Whisper
         print(f"Loading model: {model_name}...")
         try:
-            model = whisperx.load_model(model_name, device, device_index=device_index, compute_type=compute_type)
+            with _MODEL_LOCK:
+                model = _load_asr_model(model_name, device, device_index, compute_type)
         except Exception as e:
             print(f"Error: Failed to load Whisper model. Details: {e}")
             return None
@@ -62,19 +266,37 @@ def transcribe_and_align(audio_path, language="hi", device="cpu", device_index=0
     
     # SOLUTION: Boost volume by 10dB to help AI hear early lyrics over loud backgrounds
     # Scaling factor for 10dB is 10^(10/20) ≈ 3.16
-    audio = audio * 3.16
+    # (in place: load_audio returns a fresh float32 array, no need for a second copy)
+    # Only for Whisper transcription: anchored lyrics go straight to forced
+    # alignment, which does not need the boost
+    if not lyrics_text:
+        np.multiply(audio, np.float32(3.16), out=audio)
+
+    # Segments the language-detection rough pass already decoded from the start
+    # of the song, reused by the main transcription below; rough_covers_song
+    # marks a song short enough that the rough pass already decoded all of it
+    rough_prefix = None
+    rough_covers_song = False
 
     # NEW: Automatic Language Detection (with 1-minute voice scan & Gemini 2.5 Flash Verification)
     # ONLY Run this if we are NOT using Lyric Anchoring (because if we have text, we don't need to guess)
     if not lyrics_text and (language == "auto" or language is None):
         print("Detecting language (scanning first 60s for vocals)...")
         duration_to_scan = 60 # seconds
+        # audio_segment and detection_audio below are views into audio (basic
+        # slices of a contiguous array), and torch.from_numpy shares that
+        # buffer, so detection adds no waveform copies
         audio_segment = audio[:16000 * duration_to_scan]
         
         try:
             # Step 1: Find where vocals start using VAD
-            vad_model = load_vad_model(device, token=None)
-            vad_result = vad_model({"waveform": torch.from_numpy(audio_segment).unsqueeze(0), "sample_rate": 16000})
+            with _MODEL_LOCK:
+                vad_model = _load_vad(device)
+            # fp16 autocast on GPU. The waveform stays a float32 CPU tensor:
+            # pyannote slides its window over it and moves each batch of
+            # chunks to the model's device itself.
+            with torch.inference_mode(), torch.autocast(device_type="cuda", dtype=torch.float16, enabled=device == "cuda"):
+                vad_result = vad_model({"waveform": torch.from_numpy(audio_segment).unsqueeze(0), "sample_rate": 16000})
             
             # Binarize scores to get segments
             binarize = Binarize(onset=0.5, offset=0.363)
@@ -93,55 +315,42 @@ def transcribe_and_align(audio_path, language="hi", device="cpu", device_index=0
                 detection_audio = audio_segment[:30 * 16000]
 
             # Step 2: Whisper Rough Pass Guess
-            whisper_guess = model.detect_language(detection_audio)
-            print(f"Whisper guess: {whisper_guess}")
-
-            # Step 3: Gemini 2.5 Flash Verification
-            print("Verifying language with Gemini 2.5 Flash...")
-            # Run a tiny transcription for Gemini to read
-            rough_result = model.transcribe(detection_audio, batch_size=1, language=whisper_guess)
-            rough_text = " ".join([s["text"] for s in rough_result["segments"]])
-            
-            # Call Gemini
-            api_key = os.environ.get("GEMINI_API_KEY")
-            if api_key and rough_text.strip():
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
-                headers = {"Content-Type": "application/json"}
-                prompt = f"""Identify the most likely language of this song transcription snippet. 
-                Focus on vocabulary and grammar. 
-                Even if the transcription is messy, guess the primary language.
-                Return ONLY the ISO 639-1 code (e.g., 'hi', 'en', 'gu', 'mr', 'pa').
-                Snippet: "{rough_text}"
-                Whisper thinks it's: '{whisper_guess}'
-                Code:"""
-                
-                payload = {
-                    "contents": [{"parts": [{"text": prompt}]}],
-                    "generationConfig": {"temperature": 0.0}
-                }
-                
-                response = requests.post(url, headers=headers, json=payload)
-                if response.status_code == 200:
-                    resp_json = response.json()
-                    gemini_code = resp_json['candidates'][0]['content']['parts'][0]['text'].strip().lower()
-                    # Clean up any extra text Gemini might have returned
-                    if len(gemini_code) > 2:
-                        import re
-                        match = re.search(r'\b(hi|en|gu|mr|pa|bn|ta|te|kn)\b', gemini_code)
-                        if match:
-                            gemini_code = match.group(1)
-                    
-                    if gemini_code in ["hi", "en", "gu", "mr", "pa"]:
-                        print(f"Gemini 2.5 Flash verified language: {gemini_code}")
-                        language = gemini_code
-                    else:
-                        print(f"Gemini suggested code {gemini_code}, but sticking to Whisper's {whisper_guess} for stability.")
-                        language = whisper_guess
-                else:
-                    print(f"Gemini verification failed (Status: {response.status_code}). Using Whisper guess.")
-                    language = whisper_guess
+            whisper_guess, guess_probability = _detect_language(model, detection_audio)
+            if guess_probability is not None:
+                print(f"Whisper guess: {whisper_guess} ({guess_probability:.2f})")
             else:
+                print(f"Whisper guess: {whisper_guess}")
+
+            if (guess_probability is not None and guess_probability >= _CONFIDENT_LANGUAGE_PROB
+                    and whisper_guess in _VERIFIED_LANGUAGES):
+                # Clear winner: no rough transcription or Gemini round-trip needed
+                print("Confident guess, skipping Gemini verification.")
                 language = whisper_guess
+            else:
+                # Step 3: Gemini 2.5 Flash Verification
+                print("Verifying language with Gemini 2.5 Flash...")
+                # Run a tiny transcription for Gemini to read
+                rough_result = model.transcribe(detection_audio, batch_size=1, language=whisper_guess)
+                rough_text = " ".join([s["text"] for s in rough_result["segments"]])
+                
+                # Ask Gemini on a worker thread; meanwhile warm the alignment
+                # model for Whisper's guess, which Gemini usually confirms
+                with ThreadPoolExecutor(max_workers=1) as pool:
+                    verification = pool.submit(_verify_language_gemini, rough_text, whisper_guess)
+                    try:
+                        with _MODEL_LOCK:
+                            _load_align_model(whisper_guess, device)
+                    except Exception:
+                        pass  # retried (and reported) at the alignment step
+                    language = verification.result()
+
+                # A rough pass that started at sample 0 in the final language is
+                # the opening of the main run. Its last segment may be cut by the
+                # window edge, so that one is decoded again with the rest.
+                window_start = start_sample if first_speech_start is not None else 0
+                if window_start == 0 and language == whisper_guess:
+                    rough_covers_song = len(detection_audio) >= len(audio)
+                    rough_prefix = rough_result["segments"] if rough_covers_song else rough_result["segments"][:-1]
 
         except Exception as e:
             print(f"Intelligent detection failed: {e}. Defaulting to English ('en').")
@@ -150,22 +359,47 @@ def transcribe_and_align(audio_path, language="hi", device="cpu", device_index=0
     # Step 2: Perform the actual transcription (if not Anchored)
     if not lyrics_text:
         print(f"Transcribing audio with model: {model_name} (Language: {language})")
-        result = model.transcribe(audio, batch_size=batch_size, language=language)
+        # No separate VAD trim needed: WhisperX runs its own VAD over the whole
+        # file and only decodes the speech chunks, with timestamps already in
+        # original-audio time
+        if rough_covers_song:
+            print(f"Detection pass covered the whole song, reusing its {len(rough_prefix)} segments")
+            result = {"segments": rough_prefix, "language": language}
+        elif rough_prefix:
+            resume_s = rough_prefix[-1]["end"]
+            print(f"Reusing {len(rough_prefix)} segments from the detection pass, transcribing from {resume_s:.1f}s")
+            rest = model.transcribe(audio[int(resume_s * 16000):], batch_size=batch_size, language=language)
+            for seg in rest["segments"]:
+                seg["start"] += resume_s
+                seg["end"] += resume_s
+            result = {"segments": rough_prefix + rest["segments"], "language": language}
+        else:
+            result = model.transcribe(audio, batch_size=batch_size, language=language)
 
     # 2. Align whisper output
     print("Aligning...")
-    align_kwargs = {"language_code": language, "device": device}
     if language in CUSTOM_ALIGN_MODELS:
-        align_kwargs["model_name"] = CUSTOM_ALIGN_MODELS[language]
         print(f"Using custom alignment model: {CUSTOM_ALIGN_MODELS[language]}")
 
-    try:
-        model_a, metadata = whisperx.load_align_model(**align_kwargs)
-    except Exception as e:
-        print(f"Error: Failed to load alignment model. Details: {e}")
-        return None
-        
-    result = whisperx.align(result["segments"], model_a, metadata, audio, device, return_char_alignments=False)
+    align_workers = _align_workers(device, len(result["segments"]))
+    if align_workers > 1:
+        print(f"Aligning on {align_workers} worker processes...")
+        try:
+            result = _align_parallel(result["segments"], language, audio, align_workers)
+        except Exception as e:
+            print(f"Error: Parallel alignment failed. Details: {e}")
+            return None
+    else:
+        try:
+            with _MODEL_LOCK:
+                model_a, metadata = _load_align_model(language, device)
+        except Exception as e:
+            print(f"Error: Failed to load alignment model. Details: {e}")
+            return None
+            
+        # Same audio array as the transcription pass; no autograd bookkeeping
+        with torch.inference_mode():
+            result = whisperx.align(result["segments"], model_a, metadata, audio, device, return_char_alignments=False)
 
     # 3. Format result & Calculate alignment quality
     total_words = 0
@@ -180,12 +414,12 @@ def transcribe_and_align(audio_path, language="hi", device="cpu", device_index=0
             continue
 
         seg_words = segment.get("words", [])
-        total_words += len(text.split())
+        # WhisperX joins a segment's words with single spaces, so counting
+        # separators gives the word count without building a list
+        total_words += text.count(" ") + 1
         
         # Count words that actually have timestamps
-        for w in seg_words:
-            if "start" in w and "end" in w:
-                aligned_words += 1
+        aligned_words += sum(1 for w in seg_words if "start" in w and "end" in w)
 
         segments.append({
             "text": text,
@@ -207,6 +441,25 @@ def transcribe_and_align(audio_path, language="hi", device="cpu", device_index=0
     
     return segments
 
+def transcribe_batch(audio_paths, lyrics_texts=None, **kwargs):
+    """
+    Runs transcribe_and_align over several files. The Whisper, VAD and
+    alignment models come from the process-wide caches, so the batch pays
+    for each load once (one aligner per language) instead of once per file.
+    lyrics_texts, if given, is parallel to audio_paths; other keyword
+    arguments go to every call. Returns a list parallel to audio_paths,
+    with None for files that failed.
+    """
+    results = []
+    for i, audio_path in enumerate(audio_paths):
+        lyrics_text = lyrics_texts[i] if lyrics_texts else None
+        try:
+            results.append(transcribe_and_align(audio_path, lyrics_text=lyrics_text, **kwargs))
+        except Exception as e:
+            print(f"Error: Transcription failed for {audio_path}. Details: {e}")
+            results.append(None)
+    return results
+
 def split_segments_by_silence(segments, min_gap=2.0):
     """
     Splits a segment into multiple segments if there is a silence gap > min_gap between words.
@@ -220,51 +473,39 @@ def split_segments_by_silence(segments, min_gap=2.0):
             new_segments.append(seg)
             continue
             
-        current_segment_words = []
-        if words:
-             last_end_time = words[0]["start"]
+        # Gap before each timed word: its start minus the previous timed word's
+        # end (the first one is measured from the segment's first word).
+        # Untimed words stay with the words before them.
+        timed = np.fromiter((i for i, w in enumerate(words)
+                             if w.get("start") is not None and w.get("end") is not None), dtype=np.intp)
+        starts = np.fromiter((words[i]["start"] for i in timed.tolist()), dtype=np.float64, count=len(timed))
+        ends = np.fromiter((words[i]["end"] for i in timed.tolist()), dtype=np.float64, count=len(timed))
+        prev_ends = np.concatenate(([words[0]["start"]], ends[:-1]))
+        cuts = timed[(starts - prev_ends > min_gap) & (timed > 0)].tolist()
+        bounds = [0] + cuts + [len(words)]
         
-        for w in words:
-            start = w.get("start")
-            end = w.get("end")
-            
-            if start is None or end is None:
-                current_segment_words.append(w)
-                continue
-                
-            # Check for gap
-            gap = start - last_end_time
-            
-            if gap > min_gap and current_segment_words:
-                # Close current segment
-                seg_start = current_segment_words[0]["start"]
-                seg_end = current_segment_words[-1]["end"]
-                seg_text = " ".join([word["word"] for word in current_segment_words])
-                
-                new_segments.append({
-                    "start": seg_start,
-                    "end": seg_end,
-                    "text": seg_text,
-                    "words": current_segment_words
-                })
-                current_segment_words = []
-            
-            current_segment_words.append(w)
-            last_end_time = end
-            
-        # Append remaining
-        if current_segment_words:
-            seg_start = current_segment_words[0].get("start", seg["start"])
-            seg_end = current_segment_words[-1].get("end", seg["end"])
-            seg_text = " ".join([word["word"] for word in current_segment_words])
-            
+        for lo, hi in zip(bounds[:-2], bounds[1:-1]):
+            current_segment_words = words[lo:hi]
             new_segments.append({
-                "start": seg_start,
-                "end": seg_end,
-                "text": seg_text,
+                "start": current_segment_words[0]["start"],
+                "end": current_segment_words[-1]["end"],
+                "text": " ".join([word["word"] for word in current_segment_words]),
                 "words": current_segment_words
             })
             
+        # Append remaining
+        current_segment_words = words[bounds[-2]:]
+        seg_start = current_segment_words[0].get("start", seg["start"])
+        seg_end = current_segment_words[-1].get("end", seg["end"])
+        seg_text = " ".join([word["word"] for word in current_segment_words])
+        
+        new_segments.append({
+            "start": seg_start,
+            "end": seg_end,
+            "text": seg_text,
+            "words": current_segment_words
+        })
+            
     return new_segments
 
 if __name__ == "__main__":